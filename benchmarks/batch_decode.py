@@ -0,0 +1,37 @@
+# Measures how the decode of a batch import scales with the number of worker processes,
+# everything but the Blender mesh building (the geometry cache is not used). The buffer
+# cache of the model manager persists between the runs, as it does in a Blender session.
+# usage : python benchmarks/batch_decode.py [--workers 1,2,4,8] paths...
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nitropy import batch, scanner
+
+def Run(paths, workerCounts):
+    files = [path for path in scanner.FindFiles(paths) if scanner.HasExtension(path, batch.ImportedExtensions)]
+    baseline = None
+    for workers in workerCounts:
+        start = time.perf_counter()
+        modelCount = vertexCount = 0
+        for path, models, error in batch.DecodeFiles(files, workers, batch.DecodeOptions(useCache=False)):
+            modelCount += len(models)
+            vertexCount += sum(decoded.VertexCount for decoded in models)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:3} workers : {elapsed:8.3f} s  {len(files) / elapsed:9.1f} files/s  "
+              f"x{baseline / elapsed:5.2f}  ({modelCount} models, {vertexCount} vertices)")
+    # the shapes decoded in this process, by the 1 worker runs
+    print(f"buffer cache : {batch.GetModelManager(False, False).Stats}")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", default=",".join(str(1 << i) for i in range(cores.bit_length()) if 1 << i <= cores))
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+    Run(args.paths, [int(workers) for workers in args.workers.split(",")])
@@ -0,0 +1,111 @@
+# Measures LZ10/LZ11 compression ratio and throughput on large synthetic inputs, or on
+# the given files.
+# usage : python benchmarks/lz_throughput.py [--size MB] [--repeat N] [--levels 1,6,9] [files...]
+import sys
+import os
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nitropy import compression
+
+def MakeSynthetic(size, lz11, seed=0, literalRatio=0.3):
+    """Builds a valid compressed stream token by token, with mesh-like data (small repeating
+    records) so the back references look like those of real G3d files.
+    Returns (compressed, decompressed)."""
+    rng = random.Random(seed)
+    out = bytearray()
+    src = bytearray([compression.LZ11 if lz11 else compression.LZ10, size & 0xFF, size >> 8 & 0xFF, size >> 16 & 0xFF])
+    maxLength = 0x10110 if lz11 else 18
+    while len(out) < size:
+        flagPos = len(src)
+        src.append(0)
+        for bit in range(8):
+            if len(out) >= size:
+                break
+            if len(out) < 3 or rng.random() < literalRatio:
+                out.append(rng.getrandbits(8))
+                src.append(out[-1])
+                continue
+            disp = rng.randint(1, min(len(out), 0x1000))
+            length = min(rng.choice([3, 4, 8, 12, 16, 18, 32, 64, 300]), maxLength, size - len(out))
+            if length < 3:
+                out.append(rng.getrandbits(8))
+                src.append(out[-1])
+                continue
+            for i in range(length):
+                out.append(out[-disp])
+            src[flagPos] |= 0x80 >> bit
+            d = disp - 1
+            if not lz11:
+                src += bytes([(length - 3) << 4 | d >> 8, d & 0xFF])
+            elif length <= 0x10:
+                src += bytes([(length - 1) << 4 | d >> 8, d & 0xFF])
+            elif length <= 0x110:
+                l = length - 0x11
+                src += bytes([l >> 4, (l & 0xF) << 4 | d >> 8, d & 0xFF])
+            else:
+                l = length - 0x111
+                src += bytes([1 << 4 | l >> 12, l >> 4 & 0xFF, (l & 0xF) << 4 | d >> 8, d & 0xFF])
+    return bytes(src), bytes(out)
+
+class ChunkReader:
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+    def read(self, count):
+        chunk = self._data[self._pos:self._pos + count]
+        self._pos += len(chunk)
+        return chunk
+
+def Time(function, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def RunDecompression(size, repeat):
+    for name, lz11 in (("LZ10", False), ("LZ11", True)):
+        compressed, expected = MakeSynthetic(size, lz11)
+        elapsed, result = Time(lambda: compression.Decompress(compressed), repeat)
+        if result != expected:
+            raise Exception(f"{name} : decompressed data mismatch")
+        print(f"{name} decompress one-shot : {size / elapsed / 1e6:7.2f} MB/s  ({len(compressed) / size:.3f} ratio)")
+        elapsed, result = Time(lambda: compression.DecompressStream(ChunkReader(compressed)), repeat)
+        if result != expected:
+            raise Exception(f"{name} : streamed data mismatch")
+        print(f"{name} decompress stream   : {size / elapsed / 1e6:7.2f} MB/s")
+
+def RunCompression(inputs, levels, repeat):
+    for inputName, data in inputs:
+        for name, type in (("LZ10", compression.LZ10), ("LZ11", compression.LZ11)):
+            for level in levels:
+                elapsed, result = Time(lambda: compression.Compress(data, type, level), repeat)
+                if compression.Decompress(result) != data:
+                    raise Exception(f"{name} level {level} : round trip mismatch on {inputName}")
+                print(f"{name} compress level {level} : {len(data) / elapsed / 1e6:7.2f} MB/s  "
+                      f"{len(result) / len(data):.3f} ratio  ({inputName})")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=4.0, help="decompressed size in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--levels", default="1,6,9")
+    parser.add_argument("files", nargs="*")
+    args = parser.parse_args(argv)
+    size = int(args.size * 1024 * 1024)
+    RunDecompression(size, args.repeat)
+    if args.files:
+        inputs = []
+        for path in args.files:
+            with open(path, "rb") as file:
+                inputs.append((os.path.basename(path), file.read()))
+    else:
+        inputs = [("synthetic", MakeSynthetic(size, False)[1])]
+    RunCompression(inputs, [int(level) for level in args.levels.split(",")], args.repeat)
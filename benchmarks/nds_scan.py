@@ -0,0 +1,31 @@
+# Times a full G3d scan of NDS roms, NARC archives included.
+# usage : python benchmarks/nds_scan.py [--repeat N] roms...
+import sys
+import os
+import time
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nitropy.binary import nds
+
+def Scan(path):
+    return list(nds.NdsRom.FromFile(path).ScanG3dFiles())
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("roms", nargs="+")
+    args = parser.parse_args(argv)
+    for path in args.roms:
+        best = None
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            found = Scan(path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        kinds = Counter(file.Signature.decode("ascii") for _, file in found)
+        print(f"{os.path.basename(path)} : {best * 1000:8.2f} ms  {os.path.getsize(path) / best / 1e6:8.1f} MB/s  "
+              f"{len(found)} G3d files {dict(kinds)}")
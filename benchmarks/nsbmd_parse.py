@@ -0,0 +1,51 @@
+# Compares the Nsbmd loading paths on a set of files.
+# usage : python benchmarks/nsbmd_parse.py [--repeat N] files...
+#
+# "stream" hands an open file object to Nsbmd, the only entry point older revisions have,
+# so running this script on them gives the baseline numbers to compare against.
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nitropy.binary import nsbmd
+
+def LoadStream(path):
+    with open(path, "rb") as file:
+        return nsbmd.Nsbmd(file)
+
+def LoadBuffer(path):
+    return nsbmd.Nsbmd.FromFile(path)
+
+def LoadMmap(path):
+    return nsbmd.Nsbmd.FromFile(path, useMmap=True)
+
+MODES = {
+    "stream": LoadStream,
+    "buffer": LoadBuffer,
+    "mmap": LoadMmap,
+}
+
+def Run(paths, repeat):
+    totalSize = sum(os.path.getsize(path) for path in paths)
+    for name, load in MODES.items():
+        if not hasattr(nsbmd.Nsbmd, "FromFile") and name != "stream":
+            continue
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            for path in paths:
+                load(path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>8} : {best * 1000:9.2f} ms  {len(paths) / best:9.1f} files/s  {totalSize / best / 1e6:8.2f} MB/s")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+    Run(args.files, args.repeat)
@@ -0,0 +1,49 @@
+# Times the SBC interpreter : every model of the files is drawn N times with the NoGeCmd
+# flag, which walks the whole bytecode and the node descriptions without drawing.
+# With --matrices the geometry engine commands run too, the shapes still not being drawn.
+# usage : python benchmarks/sbc_draw.py [--draws N] [--matrices] files...
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nitropy.binary import nsbmd, model
+from nitropy.binary.nitro import G3dRenderObjectFlag
+
+def Run(paths, draws, matrices):
+    renderContext = model.RenderContext(model.GeometryEngineState(), model.NullSink())
+    flag = 0 if matrices else G3dRenderObjectFlag.NoGeCmd.value
+    renderObjs = []
+    for path in paths:
+        modelSet = nsbmd.Nsbmd.FromFile(path).ModelSet
+        for i in range(len(modelSet.Models)):
+            renderObj = model.G3dRenderObject(modelSet.Models[i])
+            renderObj.Flag = flag
+            renderObj.ShapeProxies = [None] * len(renderObj.ModelResource.Shapes.Shapes)
+            renderObjs.append(renderObj)
+
+    start = time.perf_counter()
+    for renderObj in renderObjs:
+        renderContext.Sbc.Draw(renderObj)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(draws):
+        for renderObj in renderObjs:
+            renderObj.Flag = flag
+            renderContext.Sbc.Draw(renderObj)
+    elapsed = time.perf_counter() - start
+    total = draws * len(renderObjs)
+    print(f"first draw : {first * 1000:9.2f} ms for {len(renderObjs)} models")
+    print(f"    draws : {elapsed * 1000:9.2f} ms  {total / elapsed:9.1f} draws/s")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--draws", type=int, default=100)
+    parser.add_argument("--matrices", action="store_true")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+    Run(args.files, args.draws, args.matrices)
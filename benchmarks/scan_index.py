@@ -0,0 +1,35 @@
+# Measures how the model index scan scales with the number of worker processes.
+# usage : python benchmarks/scan_index.py [--workers 1,2,4,8] paths...
+# (outside of Blender, mathutils has to be importable by the workers)
+import sys
+import os
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nitropy import scanner
+
+def Run(paths, workerCounts):
+    fileCount = sum(1 for _ in scanner.FindFiles(paths))
+    baseline = None
+    for workers in workerCounts:
+        with tempfile.TemporaryDirectory() as directory:
+            with scanner.ModelIndex(os.path.join(directory, "index.db")) as index:
+                start = time.perf_counter()
+                index.Scan(paths, workers)
+                elapsed = time.perf_counter() - start
+                modelCount = index.Query("SELECT COUNT(*) FROM models")[0][0]
+        baseline = baseline or elapsed
+        print(f"{workers:3} workers : {elapsed:8.3f} s  {fileCount / elapsed:9.1f} files/s  "
+              f"x{baseline / elapsed:5.2f}  ({modelCount} models)")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", default=",".join(str(1 << i) for i in range(cores.bit_length()) if 1 << i <= cores))
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+    Run(args.paths, [int(workers) for workers in args.workers.split(",")])
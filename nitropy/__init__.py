@@ -1,16 +1,31 @@
-import bpy
+try:
+    import bpy
+except ImportError:
+    # outside of Blender (tools, worker processes) the operators are not available
+    bpy = None
 import pip
-from .operators import *
+import importlib
+
+# the submodules are already imported when Blender reloads the add-on, not on the first import
+reloading = "binary" in locals()
+
+if bpy is not None:
+    from .operators import *
 from .binary import *
+from . import batch
 
-if "nitro_import" in locals():
-    importlib.reload(nitro_import)
-if "binary" in locals():
-    importlib.reload(nsbmd)
+if reloading:
+    importlib.reload(layout)
     importlib.reload(nitro)
-    importlib.reload(sbc)
     importlib.reload(displaylist)
+    importlib.reload(sbc)
+    importlib.reload(sink)
+    importlib.reload(nsbmd)
     importlib.reload(model)
+    importlib.reload(narc)
+    importlib.reload(nds)
+if reloading and "nitro_import" in locals():
+    importlib.reload(nitro_import)
 
 bl_info = {
         "name": "NitroPy",
@@ -25,26 +40,28 @@ bl_info = {
         "support": "COMMUNITY",
         }
 
-class Nitro_Menu_Import(bpy.types.Menu):
-    bl_label = "NitroPy (.nsbmd)"
-    bl_idname = "TOPBAR_MT_file_nitro_import"
+if bpy is not None:
+    class Nitro_Menu_Import(bpy.types.Menu):
+        bl_label = "NitroPy (.nsbmd)"
+        bl_idname = "TOPBAR_MT_file_nitro_import"
     
-    def draw(self, context):
-        layout = self.layout
-        layout.operator(ImportNitro.bl_idname, text="Model (.nsbmd)", icon="MESH_DATA")
-
-def draw_menu_import(self, context):
-    self.layout.menu(Nitro_Menu_Import.bl_idname)
-
-def register():
-    bpy.utils.register_class(Nitro_Menu_Import)
-    bpy.utils.register_class(ImportNitro)
-    bpy.types.TOPBAR_MT_file_import.append(draw_menu_import)
-
-def unregister():
-    bpy.utils.unregister_class(Nitro_Menu_Import)
-    bpy.utils.unregister_class(ImportNitro)
-    bpy.types.TOPBAR_MT_file_import.remove(draw_menu_import)
+        def draw(self, context):
+            layout = self.layout
+            layout.operator(ImportNitro.bl_idname, text="Model (.nsbmd, .narc)", icon="MESH_DATA")
+
+    def draw_menu_import(self, context):
+        self.layout.menu(Nitro_Menu_Import.bl_idname)
+
+    def register():
+        bpy.utils.register_class(Nitro_Menu_Import)
+        bpy.utils.register_class(ImportNitro)
+        bpy.types.TOPBAR_MT_file_import.append(draw_menu_import)
+
+    def unregister():
+        bpy.utils.unregister_class(Nitro_Menu_Import)
+        bpy.utils.unregister_class(ImportNitro)
+        bpy.types.TOPBAR_MT_file_import.remove(draw_menu_import)
+        batch.Shutdown()
 
 if __name__ == "__main__":
     register()
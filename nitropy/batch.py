@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .binary import nsbmd, narc, model
+from . import cache
+from .scanner import HasExtension
+
+ImportedExtensions = (".nsbmd", ".narc", ".carc")
+
+# threads reading the files ahead of the decode
+ReadThreads = 4
+
+class DecodedModel:
+    """The shapes drawn by a model, decoded without Blender. Picklable, so the worker
+    processes can send it back to the importer, which only has to build the meshes."""
+    def __init__(self, name, shapeNames, textureSizes, draws, weldedVertexCount):
+        self.Name = name
+        self.ShapeNames = shapeNames
+        # (width, height) of the texture of every material, None when it has none
+        self.TextureSizes = textureSizes
+        # (shape index, material index, DisplayListBuffer) of every draw, in draw order
+        self.Draws = draws
+        self.WeldedVertexCount = weldedVertexCount
+
+    @property
+    def VertexCount(self):
+        return sum(len(buffer.Positions) for _, _, buffer in self.Draws)
+
+    def GetTextureSize(self, materialIndex):
+        return self.TextureSizes[materialIndex] if materialIndex >= 0 else None
+
+class DecodeOptions:
+    """What DecodeFile decodes and how. By default only the first model of every .nsbmd,
+    with allModels all of them, with modelNames the models of these names."""
+    def __init__(self, useCache=True, weld=False, quads=False, allModels=False, modelNames=None):
+        self.UseCache = useCache
+        self.Weld = weld
+        self.Quads = quads
+        self.AllModels = allModels
+        self.ModelNames = modelNames
+
+    def SelectModels(self, modelSet):
+        """Returns the indices of the models to decode and the model names matching none."""
+        if self.ModelNames:
+            indices = [modelSet.Models.IndexOf(name) for name in self.ModelNames]
+            return ([index for index in indices if index >= 0],
+                    [name for name, index in zip(self.ModelNames, indices) if index < 0])
+        return (list(range(len(modelSet.Models))) if self.AllModels else [0]), []
+
+# the G3dModelManager of every weld/quads combination, kept for the life of the process
+# (the session in Blender, the pool in the workers) so shapes found again are not decoded twice
+_modelManagers = {}
+
+def GetModelManager(weld, quads):
+    manager = _modelManagers.get((weld, quads))
+    if manager is None:
+        manager = _modelManagers[(weld, quads)] = model.G3dModelManager(weld, quads)
+    return manager
+
+def DecodeModel(nsbmdFile, modelIndex, geometryCache, modelManager):
+    collector = model.CollectorSink()
+    renderGroup = model.ModelRenderGroup(nsbmdFile, modelIndex, geometryCache, sink=collector, modelManager=modelManager)
+    renderGroup.InitModel()
+    renderGroup.Render()
+
+    g3dModel = renderGroup.model
+    textureSizes = [(material.OriginalWidth, material.OriginalHeight)
+                    if material.OriginalWidth and material.OriginalHeight else None
+                    for material in g3dModel.Materials.Materials]
+    decoded = DecodedModel(nsbmdFile.ModelSet.Dictionary.Data[modelIndex].Name,
+                           [entry.Name for entry in g3dModel.Shapes.ShapeDictionary.Data],
+                           textureSizes,
+                           [(draw.Index, draw.Material.Index, draw.Buffer) for draw in collector.Draws],
+                           renderGroup.WeldedVertexCount)
+    # the decoded model keeps its buffers alive, the manager may now drop them past its budget
+    renderGroup.Release()
+    return decoded
+
+def DecodeNsbmd(data, options, geometryCache=None):
+    """Returns the decoded models and the names of options.ModelNames matching none."""
+    nsbmdFile = nsbmd.Nsbmd(data)
+    modelManager = GetModelManager(options.Weld, options.Quads)
+    indices, unmatched = options.SelectModels(nsbmdFile.ModelSet)
+    return [DecodeModel(nsbmdFile, modelIndex, geometryCache, modelManager) for modelIndex in indices], unmatched
+
+def DecodeFile(path, data=None, options=None):
+    """Returns (path, decoded models, error) for a .nsbmd or a NARC archive of them. data is
+    the file content when it was already read. Runs in the worker processes.
+    The names of options.ModelNames no model of the file has are reported as an error,
+    the models found being still returned."""
+    options = options or DecodeOptions()
+    try:
+        if data is None:
+            data = nsbmd.ReadBuffer(path, True)
+        geometryCache = cache.GeometryCache() if options.UseCache else None
+        if HasExtension(path, ".nsbmd"):
+            models, unmatched = DecodeNsbmd(data, options, geometryCache)
+        else:
+            # every model of the archive in one pass, without extracting it
+            archive = narc.Narc(data)
+            models = []
+            unmatched = list(options.ModelNames or ())
+            for file in archive.FindSignature(b"BMD0"):
+                decoded, unmatchedInFile = DecodeNsbmd(file.Data, options, geometryCache)
+                models.extend(decoded)
+                unmatched = [name for name in unmatched if name in unmatchedInFile]
+        error = f"No model named {', '.join(unmatched)}" if unmatched else None
+        return path, models, error
+    except Exception as e:
+        return path, [], f"{type(e).__name__}: {e}"
+
+def ReadFile(path):
+    """The file content, None when it can not be read (DecodeFile reports why)."""
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except OSError:
+        return None
+
+def ReadAhead(paths, window):
+    """Yields (path, content) for every path in order, window files being read ahead on threads."""
+    with ThreadPoolExecutor(ReadThreads) as executor:
+        pending = deque()
+        try:
+            for path in paths:
+                pending.append((path, executor.submit(ReadFile, path)))
+                if len(pending) >= window:
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            while pending:
+                path, future = pending.popleft()
+                yield path, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+# the worker processes, kept between the imports so their model managers are too
+_executor = None
+_executorWorkers = 0
+
+def GetExecutor(workers):
+    global _executor, _executorWorkers
+    if _executor is None or _executorWorkers != workers:
+        Shutdown()
+        _executor = ProcessPoolExecutor(workers)
+        _executorWorkers = workers
+    return _executor
+
+def Shutdown():
+    """Stops the worker processes, the next DecodeFiles starting new ones."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+def DecodeFiles(paths, workers=None, options=None):
+    """Yields the DecodeFile result of every path, in order. The files are read ahead on
+    threads and decoded over workers processes (every core by default, 1 decodes in this
+    process), at most two files per worker being in flight."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    files = ReadAhead(paths, workers * 2)
+    if workers <= 1 or len(paths) <= 1:
+        for path, data in files:
+            yield DecodeFile(path, data, options)
+        return
+    executor = GetExecutor(workers)
+    pending = deque()
+    try:
+        for path, data in files:
+            pending.append(executor.submit(DecodeFile, path, data, options))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # a worker died, the next imports get a new pool
+        Shutdown()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+        files.close()
+
+class BackgroundDecoder:
+    """Runs DecodeFiles on a thread, so the caller can pick the results up without blocking.
+    At most queueSize results wait to be picked up, the decode pausing past that."""
+    def __init__(self, paths, workers=None, options=None, queueSize=8):
+        self.Paths = paths
+        self.Error = None
+        self._results = queue.Queue(queueSize)
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._Run, args=(workers, options), daemon=True)
+
+    def Start(self):
+        self._thread.start()
+
+    def Cancel(self):
+        """Stops after the file being handed over, the files in flight are dropped."""
+        self._cancel.set()
+
+    @property
+    def Done(self):
+        return self._finished.is_set() and self._results.empty()
+
+    def Get(self):
+        """The next DecodeFile result in path order, None when none is ready yet."""
+        try:
+            return self._results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _Put(self, result):
+        while not self._cancel.is_set():
+            try:
+                self._results.put(result, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _Run(self, workers, options):
+        results = DecodeFiles(self.Paths, workers, options)
+        try:
+            for result in results:
+                if not self._Put(result):
+                    break
+        except Exception as e:
+            # a worker process died, the pool can not decode anything anymore
+            self.Error = f"{type(e).__name__}: {e}"
+        finally:
+            results.close()
+            self._finished.set()
@@ -1,5 +1,9 @@
 from .nsbmd import *
+from .layout import *
 from .nitro import *
 from .displaylist import *
 from .model import *
-from .sbc import *
\ No newline at end of file
+from .sbc import *
+from .sink import *
+from .narc import *
+from .nds import *
\ No newline at end of file
@@ -2,7 +2,7 @@ from .nitro import *
 from struct import unpack
 from enum import Enum
 from io import BytesIO
-from mathutils import Matrix, Vector
+import numpy as np
 
 class GxCmd:
     Nop = 0x00
@@ -52,52 +52,50 @@ class GxCmd:
     VectorTest   = 0x72
 
 class GxCmdUtil:
+    ParamCounts = {
+        GxCmd.Nop            : 0,
+        GxCmd.MatrixMode     : 1,
+        GxCmd.PushMatrix     : 0,
+        GxCmd.PopMatrix      : 1,
+        GxCmd.StoreMatrix    : 1,
+        GxCmd.RestoreMatrix  : 1,
+        GxCmd.Identity       : 0,
+        GxCmd.LoadMatrix44   : 16,
+        GxCmd.LoadMatrix43   : 12,
+        GxCmd.MultMatrix44   : 16,
+        GxCmd.MultMatrix43   : 12,
+        GxCmd.MultMatrix33   : 9,
+        GxCmd.Scale          : 3,
+        GxCmd.Translate      : 3,
+        GxCmd.Color          : 1,
+        GxCmd.Normal         : 1,
+        GxCmd.TexCoord       : 1,
+        GxCmd.Vertex         : 2,
+        GxCmd.VertexShort    : 1,
+        GxCmd.VertexXY       : 1,
+        GxCmd.VertexXZ       : 1,
+        GxCmd.VertexYZ       : 1,
+        GxCmd.VertexDiff     : 1,
+        GxCmd.PolygonAttr    : 1,
+        GxCmd.TexImageParam  : 1,
+        GxCmd.TexPlttBase    : 1,
+        GxCmd.MaterialColor0 : 1,
+        GxCmd.MaterialColor1 : 1,
+        GxCmd.LightVector    : 1,
+        GxCmd.LightColor     : 1,
+        GxCmd.Shininess      : 32,
+        GxCmd.Begin          : 1,
+        GxCmd.End            : 0,
+        GxCmd.SwapBuffers    : 1,
+        GxCmd.Viewport       : 1,
+        GxCmd.BoxTest        : 3,
+        GxCmd.PositionTest   : 2,
+        GxCmd.VectorTest     : 1,
+    }
+    
     @staticmethod
     def GetParamCount(cmd):
-        cmdcount = {
-            GxCmd.Nop            : 0,
-            GxCmd.MatrixMode     : 1,
-            GxCmd.PushMatrix     : 0,
-            GxCmd.PopMatrix      : 1,
-            GxCmd.StoreMatrix    : 1,
-            GxCmd.RestoreMatrix  : 1,
-            GxCmd.Identity       : 0,
-            GxCmd.LoadMatrix44   : 16,
-            GxCmd.LoadMatrix43   : 12,
-            GxCmd.MultMatrix44   : 16,
-            GxCmd.MultMatrix43   : 12,
-            GxCmd.MultMatrix33   : 9,
-            GxCmd.Scale          : 3,
-            GxCmd.Translate      : 3,
-            GxCmd.Color          : 1,
-            GxCmd.Normal         : 1,
-            GxCmd.TexCoord       : 1,
-            GxCmd.Vertex         : 2,
-            GxCmd.VertexShort    : 1,
-            GxCmd.VertexXY       : 1,
-            GxCmd.VertexXZ       : 1,
-            GxCmd.VertexYZ       : 1,
-            GxCmd.VertexDiff     : 1,
-            GxCmd.PolygonAttr    : 1,
-            GxCmd.TexImageParam  : 1,
-            GxCmd.TexPlttBase    : 1,
-            GxCmd.MaterialColor0 : 1,
-            GxCmd.MaterialColor1 : 1,
-            GxCmd.LightVector    : 1,
-            GxCmd.LightColor     : 1,
-            GxCmd.Shininess      : 32,
-            GxCmd.Begin          : 1,
-            GxCmd.End            : 0,
-            GxCmd.SwapBuffers    : 1,
-            GxCmd.Viewport       : 1,
-            GxCmd.BoxTest        : 3,
-            GxCmd.PositionTest   : 2,
-            GxCmd.VectorTest     : 1,
-        }
-        count = cmdcount.get(cmd)
-        if not count:
-            count = 0
-        return count
+        return GxCmdUtil.ParamCounts.get(cmd, 0)
     
     @staticmethod
     def IsValid(cmd) -> bool:
@@ -119,20 +117,22 @@ class GxCmdUtil:
     
     @staticmethod
     def ParseDl(dl, callback):
-        offs = 0
-        while offs + 4 <= len(dl):
-            ops = unpack("<I", dl[offs:offs+4])[0]
-            offs += 4
-            while ops != 0:
-                op = ops & 0xFF
-                if op != GxCmd.Nop and GxCmdUtil.IsValid(op):
-                    paramCount = GxCmdUtil.GetParamCount(op)
-                    param = []
-                    for i in range(paramCount):
-                        param.append(unpack("<i", dl[offs:offs+4])[0]) # does not work if the value is unsigned, idk why
-                        offs += 4
-                    callback(op, param)
-                ops >>= 8
+        words, ops, offsets = GxCmdUtil.ExpandDl(dl)
+        params = words.view(np.int32).tolist()
+        for op, offs in zip(ops.tolist(), offsets.tolist()):
+            callback(op, params[offs:offs + GxCmdUtil.ParamCounts[op]])
+    
+    @staticmethod
+    def ExpandDl(dl):
+        """Returns the display list as an uint32 array, with the opcode of each of its valid
+        commands (nops excluded) and the index of their first parameter in that array."""
+        info = DisplayListInfo(dl)
+        if info.Truncated:
+            raise Exception("Truncated display list.")
+        return info.Words, info.Ops, info.Offsets
+
+GxParamCountTable = np.array([GxCmdUtil.GetParamCount(cmd) for cmd in range(256)], dtype=np.int64)
+GxValidTable = np.array([cmd != GxCmd.Nop and GxCmdUtil.IsValid(cmd) for cmd in range(256)])
 
 class GxBegin:
     Null = -1
@@ -142,6 +142,7 @@ class GxBegin:
     QuadStrip     = 3
 
 class NitroVertexData:
+    # layout of the vertex attributes of DisplayListBuffer
     MtxIdMask     = 0x1F
     CurMtxId      = 0x1F
     HasNormalFlag = 1 << 5
@@ -150,147 +151,279 @@ class NitroVertexData:
     NrmClrIdx   = 1
     TexCoordIdx = 2
     MtxIdIdx    = 3
-    
-    def __init__(self, Position=None, NormalOrColor=None, TexCoord=None, MtxId=None):
-        self.Position = Position
-        self.NormalOrColor = NormalOrColor
-        self.TexCoord = TexCoord
-        self.MtxId = MtxId
-    def __str__(self):
-        return f"{self.Position}"
 
 class DlFlags:
     HasColors    = 1 << 0
     HasNormals   = 1 << 1
     HasTexCoords = 1 << 2
 
-class DisplayListBuffer:
+class DisplayListInfo:
+    """Pass over a display list that finds its commands, counts its vertices and polygons and
+    checks it is well formed, without decoding any vertex attribute. DisplayListBuffer decodes
+    from it, so running it first to validate a list costs nothing more.
+    Only the packed command words are visited in Python, everything else is done on arrays."""
     def __init__(self, dl):
-        self._vtxData = []
-        self._idxData = []
-        self.Flags = 0
-        
-        self.vertices  = []
-        self.indices   = []
-        self.vindices  = []
-        self.normal    = Vector([0.0, 0.0, 0.0])
-        self.texCoord  = Vector([0.0, 0.0])
-        self.mode      = -1
-        self.color     = Vector([0.0, 0.0, 0.0])
-        self.vtxX      = 0
-        self.vtxY      = 0
-        self.vtxZ      = 0
-        self.useNormal = False
-        self.mtxId     = NitroVertexData.CurMtxId
-        self.vtxCount  = 0
-        self.flags     = 0
-        GxCmdUtil.ParseDl(dl, self.ParseDlCallBack)
-        self._vtxData = self.vertices
-        self._idxData = self.indices
-        
-    def ParseDlCallBack(self, op, param):
-        if op == GxCmd.RestoreMatrix:
-            if (param[0] & 0x1F) == 0x1F:
-                raise Exception()
-            self.mtxId = param[0] & 0x1F
+        self.Errors = []
+        self.Truncated = False
+        if len(dl) % 4 != 0:
+            self.Errors.append(f"Size {len(dl)} is not a multiple of 4.")
+        words = np.frombuffer(dl, dtype="<u4", count=len(dl) // 4)
+        self.Words = words
+        count = len(words)
+        opBytes = (words[:, None] >> np.array([0, 8, 16, 24], dtype=np.uint32)) & 0xFF
+        paramCounts = GxParamCountTable[opBytes]
+        # where the next command word would be if each word were a command word
+        nextWords = (np.arange(1, count + 1) + paramCounts.sum(axis=1)).tolist()
+        commandWords = []
+        i = 0
+        while i < count:
+            commandWords.append(i)
+            i = nextWords[i]
+        if i > count:
+            self.Truncated = True
+            self.Errors.append(f"Truncated : the command word at {commandWords[-1] * 4:#x} needs {i - count} more parameters.")
+            commandWords.pop()
         
-        elif op == GxCmd.Color:
-            rgb5 = param[0] & 0x7FFF
-            self.color = [
-                (rgb5 & 0x1F) / 31,
-                ((rgb5 >> 5) & 0x1F) / 31,
-                ((rgb5 >> 10) & 0x1F) / 31,
-            ]
-            self.useNormal = False
-            self.flags |= DlFlags.HasColor
+        commandWords = np.array(commandWords, dtype=np.int64)
+        paramCounts = paramCounts[commandWords]
+        offsets = (commandWords[:, None] + 1 + np.cumsum(paramCounts, axis=1) - paramCounts).ravel()
+        ops = opBytes[commandWords].ravel().astype(np.int64)
+        self.OpcodeHistogram = np.bincount(ops, minlength=256)
+        self.OpcodeHistogram[GxCmd.Nop] = 0
+        invalid = np.flatnonzero((self.OpcodeHistogram > 0) & ~GxValidTable)
+        if len(invalid):
+            self.Errors.append(f"Invalid opcodes : {', '.join(f'{op:#04x}' for op in invalid)}.")
+        valid = GxValidTable[ops]
+        self.Ops = ops[valid]
+        self.Offsets = offsets[valid]
         
-        elif op == GxCmd.Normal:
-            self.normal = [
-                (Short((param[0] & 0x3FF) << 6) >> 6) / 512,
-                (Short(((param[0] >> 10) & 0x3FF) << 6) >> 6) / 512,
-                (Short(((param[0] >> 20) & 0x3FF) << 6) >> 6) / 512,
-            ]
-            self.useNormal = True
-            self.flags |= DlFlags.HasNormals
+        padded = words if count else np.zeros(1, dtype=np.uint32)
+        self.P0 = padded[np.minimum(self.Offsets, len(padded) - 1)].astype(np.int64)
+        self.P1 = padded[np.minimum(self.Offsets + 1, len(padded) - 1)].astype(np.int64)
+        if (self.P0[self.Ops == GxCmd.RestoreMatrix] & 0x1F == 0x1F).any():
+            self.Errors.append("RestoreMatrix to the current matrix.")
         
-        elif op == GxCmd.TexCoord:
-            self.texCoord = [
-                Short(param[0] & 0xFFFF) / 512,
-                Short(param[0] >> 16) / 512,
-            ]
-            self.flags |= DlFlags.HasTexCoords
+        # primitive mode and index in its Begin of each vertex command
+        position = np.arange(len(self.Ops))
+        isBegin = self.Ops == GxCmd.Begin
+        self.LastBegin = self.Last(isBegin | (self.Ops == GxCmd.End))
+        lastBegin = self.LastBegin
+        self.IsVertex = (self.Ops >= GxCmd.Vertex) & (self.Ops <= GxCmd.VertexDiff)
+        mode = np.where((lastBegin >= 0) & isBegin[lastBegin], self.P0[lastBegin] & 3, GxBegin.Null)[self.IsVertex]
+        self.Emitted = mode != GxBegin.Null
+        self.VertexPositions = position[self.IsVertex][self.Emitted]
+        self.Modes = mode[self.Emitted]
+        primitive = lastBegin[self.IsVertex][self.Emitted]
+        self.VertexCount = len(self.VertexPositions)
+        first = np.ones(self.VertexCount, dtype=bool)
+        first[1:] = primitive[1:] != primitive[:-1]
+        index = np.arange(self.VertexCount)
+        self.VtxCounts = index - np.maximum.accumulate(np.where(first, index, 0))
         
-        elif op == GxCmd.Vertex:
-            self.vtxX = Short(param[0] & 0xFFFF)
-            self.vtxY = Short(param[0] >> 16)
-            self.vtxZ = Short(param[1] & 0xFFFF)
-        
-        elif op == GxCmd.VertexShort:
-            self.vtxX = Short((param[0] & 0x3FF) << 6)
-            self.vtxY = Short(((param[0] >> 10) & 0x3FF) << 6)
-            self.vtxZ = Short(((param[0] >> 20) & 0x3FF) << 6)
-        
-        elif op == GxCmd.VertexXY:
-            self.vtxX = Short(param[0] & 0xFFFF)
-            self.vtxY = Short(param[0] >> 16)
-        
-        elif op == GxCmd.VertexXZ:
-            self.vtxX = Short(param[0] & 0xFFFF)
-            self.vtxZ = Short(param[0] >> 16)
+        self.PrimitiveCounts = np.bincount(self.P0[isBegin] & 3, minlength=4)
+        self.Polygons, self.PolygonTotals = GetPolygons(self.Modes, self.VtxCounts)
+        self.QuadCount = int((self.PolygonTotals == 4).sum())
+        self.TriangleCount = len(self.PolygonTotals) + self.QuadCount
+    
+    def Last(self, mask):
+        """Index of the last command matching mask up to each command, -1 if there is none."""
+        position = np.arange(len(mask))
+        return np.maximum.accumulate(np.where(mask, position, -1)) if len(position) else position
+    
+    @property
+    def IsValid(self) -> bool:
+        return not self.Errors
+    
+    def Validate(self):
+        """Returns the problems found in the list, empty if it is well formed."""
+        return list(self.Errors)
+
+class DisplayListBuffer:
+    """Vertices of a display list as one typed array per attribute:
+    Positions (N, 3) float32, NormalsOrColors (N, 3) float32, TexCoords (N, 2) float32,
+    MtxIds (N,) uint8 with NitroVertexData.HasNormalFlag set when the vertex has a normal
+    rather than a color, and the triangles as Indices (M, 3) uint32.
+    
+    The polygons are also given as flat Loops (vertex indices) with LoopStarts/LoopTotals (uint32,
+    one per polygon) like Blender meshes store them. With quads, Quads and QuadStrip primitives
+    give one quad each instead of two triangles."""
+    def __init__(self, dl, weld=False, quads=False, info=None):
+        self.Flags = 0
+        self.WeldedVertexCount = 0
+        self._quads = quads
+        info = info or DisplayListInfo(dl)
+        if info.Truncated:
+            raise Exception("Truncated display list.")
+        self._Decode(info)
+        if weld:
+            self.Weld()
+    
+    ArrayNames = ("Positions", "NormalsOrColors", "TexCoords", "MtxIds", "Indices", "Loops", "LoopStarts", "LoopTotals")
+    
+    @property
+    def VertexCount(self):
+        return len(self.Positions)
+    
+    @property
+    def TriangleCount(self):
+        return len(self.Indices)
+    
+    @property
+    def NBytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ArrayNames)
+    
+    def HasNormal(self):
+        """Per vertex mask of the NormalsOrColors rows holding a normal."""
+        return self.MtxIds & NitroVertexData.HasNormalFlag != 0
+    
+    def _Decode(self, info):
+        """Decodes every vertex of the list at once: the state each vertex sees (position
+        components, normal or color, texcoord, matrix id) is the value set by the last command
+        of its kind before it, found with running maximums of command indices."""
+        ops = info.Ops
+        p0 = info.P0
+        p1 = info.P1
+        Last = info.Last
         
-        elif op == GxCmd.VertexYZ:
-            self.vtxY = Short(param[0] & 0xFFFF)
-            self.vtxZ = Short(param[0] >> 16)
+        def Pick(values, last, default):
+            return np.where((last >= 0)[:, None], values[last], default)
         
-        elif op == GxCmd.VertexDiff:
-            self.vtxX += Short(((param[0] & 0x3FF) << 6) >> 6)
-            self.vtxY += Short((((param[0] >> 10) & 0x3FF) << 6) >> 6)
-            self.vtxZ += Short((((param[0] >> 20) & 0x3FF) << 6) >> 6)
+        isColor = ops == GxCmd.Color
+        isNormal = ops == GxCmd.Normal
+        isTexCoord = ops == GxCmd.TexCoord
+        isRestore = ops == GxCmd.RestoreMatrix
+        if isColor.any():
+            self.Flags |= DlFlags.HasColors
+        if isNormal.any():
+            self.Flags |= DlFlags.HasNormals
+        if isTexCoord.any():
+            self.Flags |= DlFlags.HasTexCoords
+        if (p0[isRestore] & 0x1F == 0x1F).any():
+            raise Exception("RestoreMatrix to the current matrix in a display list.")
         
-        elif op == GxCmd.Begin:
-            self.mode     = param[0] & 3
-            self.vtxCount = 0
+        # positions, in 1/4096 units
+        isVertex = info.IsVertex
+        vertexOps = ops[isVertex]
+        v0 = p0[isVertex]
+        v1 = p1[isVertex]
+        lo = S16(v0)
+        hi = S16(v0 >> 16)
+        count = info.VertexCount
+        emitted = info.Emitted
+        vertexPosition = info.VertexPositions
+        self.Positions = np.empty((count, 3), dtype=np.float32)
+        for axis, shift in enumerate((0, 10, 20)):
+            value = np.zeros(len(vertexOps), dtype=np.int64)
+            isSet = np.zeros(len(vertexOps), dtype=bool)
+            for op, setValue in (
+                (GxCmd.Vertex, (lo, hi, S16(v1))[axis]),
+                (GxCmd.VertexShort, S16((v0 >> shift & 0x3FF) << 6)),
+                (GxCmd.VertexXY, (lo, hi, None)[axis]),
+                (GxCmd.VertexXZ, (lo, None, hi)[axis]),
+                (GxCmd.VertexYZ, (None, lo, hi)[axis])):
+                if setValue is None:
+                    continue
+                mask = vertexOps == op
+                value[mask] = setValue[mask]
+                isSet |= mask
+            # VertexDiff offsets are added as unsigned 10 bits values, like the callback decoder did
+            diff = np.cumsum(np.where(vertexOps == GxCmd.VertexDiff, v0 >> shift & 0x3FF, 0))
+            lastSet = np.maximum.accumulate(np.where(isSet, np.arange(len(vertexOps)), -1)) \
+                if len(vertexOps) else np.zeros(0, dtype=np.int64)
+            self.Positions[:, axis] = np.where(lastSet >= 0, value[lastSet] + diff - diff[lastSet], diff)[emitted] / 4096
         
-        elif op == GxCmd.End:
-            self.mode = -1
+        lastNormal = Last(isNormal)[vertexPosition]
+        lastColor = Last(isColor)[vertexPosition]
+        useNormal = lastNormal > lastColor
+        normals = np.stack([S16((p0 >> shift & 0x3FF) << 6) >> 6 for shift in (0, 10, 20)], axis=1) / 512
+        colors = np.stack([p0 >> shift & 0x1F for shift in (0, 5, 10)], axis=1) / 31
+        self.NormalsOrColors = np.where(useNormal[:, None], Pick(normals, lastNormal, 0.0),
+                                        Pick(colors, lastColor, 0.0)).astype(np.float32).reshape(count, 3)
+        texCoords = np.stack([S16(p0), S16(p0 >> 16)], axis=1) / 512
+        self.TexCoords = Pick(texCoords, Last(isTexCoord)[vertexPosition], 0.0).astype(np.float32).reshape(count, 2)
+        lastRestore = Last(isRestore)[vertexPosition]
+        mtxIds = np.where(lastRestore >= 0, p0[lastRestore] & 0x1F, NitroVertexData.CurMtxId)
+        self.MtxIds = (mtxIds | np.where(useNormal, NitroVertexData.HasNormalFlag, 0)).astype(np.uint8)
         
-        if self.mode != GxBegin.Null and GxCmdUtil.IsVertex(op):
-            self.vertices.append(NitroVertexData(
-                    Vector([
-                        self.vtxX / 4096,
-                        self.vtxY / 4096,
-                        self.vtxZ / 4096,
-                        1.0
-                    ]),
-                    self.normal if self.normal else self.color,
-                    self.texCoord,
-                    self.mtxId | (NitroVertexData.HasNormalFlag if self.useNormal else 0)
-                )
-            )
-            
-            if self.mode == GxBegin.Triangles:
-                if self.vtxCount % 3 == 2:
-                    base = len(self.vertices) - 3
-                    self.indices.append([base, base + 1, base + 2])
-            
-            elif self.mode == GxBegin.TriangleStrip:
-                if self.vtxCount >= 2:
-                    base = len(self.vertices) - 3
-                    if self.vtxCount % 2 == 0:
-                        self.indices.append([base, base + 1, base + 2])
-                    else:
-                        self.indices.append([base + 1, base, base + 2])
-            
-            elif self.mode == GxBegin.Quads:
-                if self.vtxCount % 4 == 3:
-                    base = len(self.vertices) - 4
-                    self.indices.append([base, base + 1, base + 2])
-                    self.indices.append([base, base + 2, base + 3])
-            
-            elif self.mode == GxBegin.QuadStrip:
-                if self.vtxCount >= 4 and self.vtxCount % 2 == 0:
-                    base = len(self.vertices) - 4
-                    self.indices.append([base, base + 1, base + 3])
-                    self.indices.append([base, base + 3, base + 2])
-            
-            self.vtxCount += 1
\ No newline at end of file
+        polygons, totals = info.Polygons, info.PolygonTotals
+        self.Indices = Triangulate(polygons, totals)
+        if not self._quads:
+            polygons, totals = self.Indices, np.full(len(self.Indices), 3, dtype=np.uint32)
+        self.Loops = polygons[np.arange(polygons.shape[1]) < totals[:, None]].astype(np.uint32)
+        self.LoopTotals = totals.astype(np.uint32)
+        self.LoopStarts = (np.cumsum(totals) - totals).astype(np.uint32)
+    
+    def Weld(self):
+        """Merges the vertices whose position, normal or color, texcoord and matrix id are
+        identical, and remaps the triangles onto the kept vertices (first occurrences, in their
+        original order). Returns the number of vertices removed."""
+        count = self.VertexCount
+        if count == 0:
+            return 0
+        packed = np.empty(count, dtype=[("Position", np.float32, 3), ("NormalOrColor", np.float32, 3),
+                                        ("TexCoord", np.float32, 2), ("MtxId", np.uint8)])
+        packed["Position"] = self.Positions
+        packed["NormalOrColor"] = self.NormalsOrColors
+        packed["TexCoord"] = self.TexCoords
+        packed["MtxId"] = self.MtxIds
+        # compared as raw bytes, one opaque item per vertex
+        rows = packed.view(np.dtype((np.void, packed.dtype.itemsize)))
+        _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        remap = np.empty(len(order), dtype=np.uint32)
+        remap[order] = np.arange(len(order), dtype=np.uint32)
+        keep = first[order]
+        for name in ("Positions", "NormalsOrColors", "TexCoords", "MtxIds"):
+            setattr(self, name, getattr(self, name)[keep])
+        remap = remap[inverse.ravel()]
+        self.Indices = remap[self.Indices]
+        self.Loops = remap[self.Loops]
+        removed = count - len(keep)
+        self.WeldedVertexCount += removed
+        return removed
+    
+    def GetArrays(self):
+        return {name: getattr(self, name) for name in self.ArrayNames}
+    
+    @staticmethod
+    def FromArrays(arrays, flags, weldedVertexCount=0):
+        """Rebuilds a buffer from the arrays of GetArrays."""
+        buffer = DisplayListBuffer.__new__(DisplayListBuffer)
+        buffer.Flags = flags
+        buffer.WeldedVertexCount = weldedVertexCount
+        for name in DisplayListBuffer.ArrayNames:
+            setattr(buffer, name, arrays[name])
+        return buffer
+
+def S16(values):
+    """Sign extends the low 16 bits of an int64 array."""
+    return (values & 0xFFFF ^ 0x8000) - 0x8000
+
+def GetPolygons(mode, vtxCount):
+    """Polygons closed by vertices given their primitive mode and their index in their Begin,
+    as (P, 4) vertex indices with the number of them used per polygon (3 or 4).
+    Every vertex closes at most one polygon, so the candidates are built for all of them then
+    filtered. Triangle strips alternate their winding, quad strips join the last two vertices
+    of a quad to the next two."""
+    index = np.arange(len(mode), dtype=np.int64)
+    odd = vtxCount % 2 == 1
+    polygons = np.zeros((len(mode), 4), dtype=np.int64)
+    totals = np.zeros(len(mode), dtype=np.int64)
+    
+    for mask, first, corners in (
+        ((mode == GxBegin.Triangles) & (vtxCount % 3 == 2), 2, (0, 1, 2, 0)),
+        ((mode == GxBegin.TriangleStrip) & (vtxCount >= 2) & ~odd, 2, (0, 1, 2, 0)),
+        ((mode == GxBegin.TriangleStrip) & (vtxCount >= 2) & odd, 2, (1, 0, 2, 0)),
+        ((mode == GxBegin.Quads) & (vtxCount % 4 == 3), 3, (0, 1, 2, 3)),
+        ((mode == GxBegin.QuadStrip) & (vtxCount >= 3) & odd, 3, (0, 1, 3, 2))):
+        polygons[mask] = (index[mask, None] - first) + np.array(corners)
+        totals[mask] = 3 if first == 2 else 4
+    
+    keep = totals > 0
+    return polygons[keep], totals[keep]
+
+def Triangulate(polygons, totals):
+    """Splits the quads of GetPolygons in (0, 1, 2) (0, 2, 3) triangles, keeping the order."""
+    triangles = np.stack([polygons[:, [0, 1, 2]], polygons[:, [0, 2, 3]]], axis=1)
+    keep = np.stack([np.ones(len(totals), dtype=bool), totals == 4], axis=1)
+    return triangles[keep].astype(np.uint32).reshape(-1, 3)
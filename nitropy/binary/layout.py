@@ -0,0 +1,139 @@
+from struct import Struct
+
+# type name : (struct code, is fixed point)
+FieldTypes = {
+    "u8"   : ("B", False),
+    "s8"   : ("b", False),
+    "u16"  : ("H", False),
+    "s16"  : ("h", False),
+    "u32"  : ("I", False),
+    "s32"  : ("i", False),
+    "fx16" : ("h", True),
+    "fx32" : ("i", True),
+}
+
+def Field(name, fieldType, count=1, convert=None):
+    """A record field. Fixed point types are decoded to floats, fields with a count > 1
+    are decoded to a list, convert is applied on the decoded value.
+    Fields named None are decoded but never assigned by ReadInto."""
+    return (name, fieldType, count, convert)
+
+def Padding(size):
+    return (None, "pad", size, None)
+
+class OptionalFields:
+    """Fields that are only present when every bit of whenClear is cleared and every bit
+    of whenSet is set in the value of the layout's selector field."""
+    def __init__(self, *fields, whenClear=0, whenSet=0):
+        self.Fields = fields
+        self.WhenClear = whenClear
+        self.WhenSet = whenSet
+    
+    def IsPresent(self, flags) -> bool:
+        return flags & self.WhenClear == 0 and flags & self.WhenSet == self.WhenSet
+
+class CompiledRecord:
+    def __init__(self, fields):
+        fmt = "<"
+        index = 0
+        self.Fields = []
+        self.Names = []
+        for name, type, count, convert in fields:
+            if type == "pad":
+                fmt += f"{count}x"
+                continue
+            code, fixed = FieldTypes[type]
+            fmt += f"{count}{code}" if count > 1 else code
+            self.Fields.append((name, index, count, fixed, convert))
+            self.Names.append(name)
+            index += count
+        self.Struct = Struct(fmt)
+        self.Size = self.Struct.size
+        self.Named = None not in self.Names
+        self.Raw = all(count == 1 and not fixed and convert is None for _, _, count, fixed, convert in self.Fields)
+        self.Scalar = all(count == 1 and convert is None for _, _, count, fixed, convert in self.Fields)
+        self.Scales = [1.0 / 4096.0 if fixed else 1 for _, _, _, fixed, _ in self.Fields]
+
+    def Decode(self, data, offset):
+        raw = self.Struct.unpack_from(data, offset)
+        if self.Raw:
+            return raw
+        if self.Scalar:
+            return [v * scale for v, scale in zip(raw, self.Scales)]
+        values = []
+        for name, index, count, fixed, convert in self.Fields:
+            if count == 1:
+                value = raw[index] / 4096.0 if fixed else raw[index]
+            elif fixed:
+                value = [v / 4096.0 for v in raw[index:index + count]]
+            else:
+                value = list(raw[index:index + count])
+            if convert is not None:
+                value = convert(value)
+            values.append(value)
+        return values
+
+class RecordLayout:
+    """Describes a binary record once and decodes it with a single precompiled struct.
+
+    Layouts with OptionalFields are compiled once per value of the selector field,
+    which has to be part of the fixed fields placed before the first optional group."""
+    def __init__(self, *fields, selector=None):
+        self._fields = fields
+        self._compiled = {}
+        self._selector = None
+        # the selector bits the optional fields depend on, the others not changing the layout
+        self._selectorMask = 0
+        for field in fields:
+            if not isinstance(field, tuple):
+                self._selectorMask |= field.WhenClear | field.WhenSet
+        if selector is not None:
+            prefix = []
+            for field in fields:
+                if not isinstance(field, tuple):
+                    break
+                prefix.append(field)
+                if field[0] == selector:
+                    self._selector = CompiledRecord(prefix)
+                    break
+            if self._selector is None:
+                raise Exception(f"Selector field {selector} must come before any optional field.")
+        elif any(not isinstance(field, tuple) for field in fields):
+            raise Exception("Optional fields need a selector field.")
+
+    def Compile(self, flags=0):
+        flags &= self._selectorMask
+        record = self._compiled.get(flags)
+        if record is None:
+            fields = []
+            for field in self._fields:
+                if isinstance(field, tuple):
+                    fields.append(field)
+                elif field.IsPresent(flags):
+                    fields.extend(field.Fields)
+            record = CompiledRecord(fields)
+            self._compiled[flags] = record
+        return record
+
+    def GetSize(self, data=None, offset=0):
+        return self.Compile(self._ReadSelector(data, offset)).Size
+
+    def _ReadSelector(self, data, offset):
+        if self._selector is None:
+            return 0
+        return self._selector.Struct.unpack_from(data, offset)[-1]
+
+    def Read(self, data, offset):
+        """Returns the decoded values of every non padding field, in declaration order."""
+        return self.Compile(self._ReadSelector(data, offset)).Decode(data, offset)
+
+    def ReadInto(self, target, data, offset):
+        """Assigns the decoded fields as attributes of target, returns the record size."""
+        record = self.Compile(self._ReadSelector(data, offset))
+        if record.Named:
+            target.__dict__.update(zip(record.Names, record.Decode(data, offset)))
+        else:
+            for name, value in zip(record.Names, record.Decode(data, offset)):
+                if name is not None:
+                    setattr(target, name, value)
+        return record.Size
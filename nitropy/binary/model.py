@@ -1,44 +1,132 @@
 from .nitro import *
 from . import sbc, displaylist
+from .sink import *
 from struct import unpack
+import hashlib
+from collections import OrderedDict
 from io import BytesIO
 from enum import Enum
-from mathutils import Matrix, Vector
-
-from ..operators import nitro_import
+import numpy as np
 
 class BufferCacheEntry:
-    def __init__(self, shapeProxies):
+    def __init__(self, buffer):
         self.UseCount = 0
-        self.ShapeProxies = shapeProxies
+        self.Buffer = buffer
+        self.Size = buffer.NBytes
+
+# bytes of decoded buffers a G3dModelManager keeps once no render object uses them
+DefaultBufferBudget = 256 << 20
+
 class G3dModelManager:
-    def __init__(self):
-        self._bufferCache = {}
+    """Decodes the shapes of the render objects, once per display list content : shapes
+    found again in other models or files share one buffer. The entries no render object
+    uses anymore (see ReleaseRenderObject) are kept until the cache grows past budget
+    bytes, the least recently used being evicted first."""
+    def __init__(self, weld=False, quads=False, budget=DefaultBufferBudget):
+        # least recently used first
+        self._bufferCache = OrderedDict()
+        self.Weld = weld
+        self.Quads = quads
+        self.Budget = budget
+        self.MemoryUsage = 0
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+    
+    @staticmethod
+    def GetShapeKey(dl):
+        return hashlib.blake2b(dl, digest_size=16).digest()
     
-    def InitializeRenderObject(self, renderObject, textures=None):
+    def InitializeRenderObject(self, renderObject, textures=None, shapeProxies=None):
+        """shapeProxies are buffers already decoded for the shapes (by a GeometryCache), taken
+        in place of decoding the shapes the cache does not have."""
         if renderObject.ModelResource is None:
             return
         
-        if self._bufferCache.get(renderObject.ModelResource) is None:
-            shapeProxies = [None] * len(renderObject.ModelResource.Shapes.Shapes)
-            for i in range(len(renderObject.ModelResource.Shapes.Shapes)):
-                shapeProxies[i] = self.CreateDisplayListBuffer(renderObject.ModelResource.Shapes.Shapes[i].DisplayList)
-            bufferCacheEntry = BufferCacheEntry(shapeProxies)
-            self._bufferCache[renderObject.ModelResource] = bufferCacheEntry
-        
-        bufferCacheEntry.UseCount += 1
-        renderObject.ShapeProxies = bufferCacheEntry.ShapeProxies
+        shapes = renderObject.ModelResource.Shapes.Shapes
+        shapeKeys = [None] * len(shapes)
+        buffers = [None] * len(shapes)
+        for i in range(len(shapes)):
+            key = self.GetShapeKey(shapes[i].DisplayList)
+            bufferCacheEntry = self._bufferCache.get(key)
+            if bufferCacheEntry is None:
+                self.Misses += 1
+                buffer = shapeProxies[i] if shapeProxies is not None else self.CreateDisplayListBuffer(shapes[i].DisplayList)
+                bufferCacheEntry = BufferCacheEntry(buffer)
+                self._bufferCache[key] = bufferCacheEntry
+                self.MemoryUsage += bufferCacheEntry.Size
+            else:
+                self.Hits += 1
+                self._bufferCache.move_to_end(key)
+            bufferCacheEntry.UseCount += 1
+            shapeKeys[i] = key
+            buffers[i] = bufferCacheEntry.Buffer
+        renderObject.ShapeKeys = shapeKeys
+        renderObject.ShapeProxies = buffers
+        self.Trim()
         
         #textures ...
     
+    def ReleaseRenderObject(self, renderObject):
+        """Gives back the buffers of a render object set up by InitializeRenderObject, which
+        can be evicted once no other render object uses them."""
+        if renderObject.ShapeKeys is None:
+            return
+        for key in renderObject.ShapeKeys:
+            bufferCacheEntry = self._bufferCache.get(key)
+            if bufferCacheEntry is not None and bufferCacheEntry.UseCount > 0:
+                bufferCacheEntry.UseCount -= 1
+                # released is a use too, the entry is evicted after the ones unused for longer
+                self._bufferCache.move_to_end(key)
+        renderObject.ShapeKeys = None
+        renderObject.ShapeProxies = None
+        self.Trim()
+    
+    def Trim(self):
+        """Evicts the least recently used unused entries until the cache fits its budget."""
+        if self.MemoryUsage <= self.Budget:
+            return
+        evicted = []
+        memoryUsage = self.MemoryUsage
+        for key, entry in self._bufferCache.items():
+            if memoryUsage <= self.Budget:
+                break
+            if entry.UseCount == 0:
+                evicted.append(key)
+                memoryUsage -= entry.Size
+        for key in evicted:
+            del self._bufferCache[key]
+        self.MemoryUsage = memoryUsage
+        self.Evictions += len(evicted)
+    
+    def Clear(self):
+        """Evicts every unused entry."""
+        for key in [key for key, entry in self._bufferCache.items() if entry.UseCount == 0]:
+            self.MemoryUsage -= self._bufferCache.pop(key).Size
+            self.Evictions += 1
+    
+    @property
+    def Stats(self):
+        return {
+            "Entries": len(self._bufferCache),
+            "MemoryUsage": self.MemoryUsage,
+            "Hits": self.Hits,
+            "Misses": self.Misses,
+            "Evictions": self.Evictions,
+        }
+    
     def CreateDisplayListBuffer(self, dl):
-        return displaylist.DisplayListBuffer(dl)
+        return displaylist.DisplayListBuffer(dl, self.Weld, self.Quads)
 
 class G3dRenderObject:
     def __init__(self, model):
         self.ModelResource = model
         self.Flag = 0
         self.UserSbc = None
+        self.UserSbcProgram = None
+        self.ShapeProxies = None
+        # the G3dModelManager keys of ShapeProxies, to release them
+        self.ShapeKeys = None
         self.CallbackFunction = None
         self.CallbackCmd = 0
         self.CallbackTiming = 0
@@ -56,7 +144,7 @@ class G3dRenderObject:
 
 class G3dGlobalState:
     def __init__(self):
-        self.CameraMatrix = Matrix.Identity(4)
+        self.CameraMatrix = np.identity(4)
         self.MaterialColor0 = 0x4210C210
         self.MaterialColor1 = 0x4210C210
         self.PolygonAttr = GxPolygonAttr(0)
@@ -65,44 +153,46 @@ class G3dGlobalState:
         self.PolygonAttr.GxCull = GxCull.Back
         self.PolygonAttr.PolygonId = 0
         self.PolygonAttr.Alpha = 31
-        self.BaseTrans = Vector([0.0, 0.0, 0.0])
-        self.BaseRot = Matrix.Identity(3)
-        self.BaseScale = Vector([1.0, 1.0, 1.0])
+        self.BaseTrans = np.zeros(3)
+        self.BaseRot = np.identity(3)
+        self.BaseScale = np.ones(3)
         self.TexImageParam = None
     
     def FlushP(self, geState):
         geState.LoadMatrix(self.CameraMatrix)
         geState.MaterialColor0 = self.MaterialColor0
         geState.MaterialColor1 = self.MaterialColor1
-        geState.MultMatrix(Matrix([
+        geState.MultMatrix43([
             self.BaseRot[0],
             self.BaseRot[1],
             self.BaseRot[2],
-            self.BaseTrans]))
+            self.BaseTrans])
         geState.Scale(self.BaseScale)
         geState.TexImageParam = self.TexImageParam
 
 class G3dGlobalRenderState:
     def __init__(self):
-        self.MaterialCache = [MaterialAnimationResult()] * G3dConfig.MaxMaterialCount
-        self.ScaleCache = [self.ScaleCacheEntry()] * G3dConfig.MaxJointCount
-        self.EnvelopeCache = [self.EnvelopeCacheEntry()] * G3dConfig.MaxJointCount
+        self.MaterialCache = [MaterialAnimationResult() for i in range(G3dConfig.MaxMaterialCount)]
+        self.ScaleCache = [self.ScaleCacheEntry() for i in range(G3dConfig.MaxJointCount)]
+        self.EnvelopeCache = [self.EnvelopeCacheEntry() for i in range(G3dConfig.MaxJointCount)]
     class ScaleCacheEntry:
         def __init__(self):
-            self.Scale = Vector([0.0, 0.0, 0.0])
-            self.InverseScale = Vector([0.0, 0.0, 0.0])
+            self.Scale = np.zeros(3)
+            self.InverseScale = np.zeros(3)
     class EnvelopeCacheEntry:
         def __init__(self):
-            self.PositionMtx = Matrix.Identity(4)
-            self.DirectionMtx = Matrix.Identity(3)
+            self.PositionMtx = np.identity(4)
+            self.DirectionMtx = np.identity(4)
 
 class RenderContext:
-    def __init__(self, geState):
+    def __init__(self, geState, sink=None):
         self.GeState = geState
         self.GlobalRenderState = G3dGlobalRenderState()
         self.GlobalState = G3dGlobalState()
         self.Sbc = sbc.Sbc(self)
         self.RenderState = None
+        # the ShapeSink the drawn shapes go to
+        self.Sink = sink or NullSink()
         self.GetJointScaleFuncArray = [
             Basic.GetJointScale,
             Maya.GetJointScale,
@@ -120,11 +210,17 @@ class RenderContext:
             None, #Xsi
         ]
     
-    def RenderShp(self, shp, buffer):
-        nitro_import.render_shp(shp, buffer)
+    def RenderShp(self, shpIdx, shp, buffer, matIdx):
+        geState = self.GeState
+        material = ShapeMaterial(matIdx, geState.MaterialColor0, geState.MaterialColor1,
+                                 geState.PolygonAttr, geState.TexImageParam)
+        self.Sink.DrawShape(shpIdx, shp, buffer, geState.PositionMatrix, geState.DirectionMatrix, material)
 
 class GeometryEngineState:
+    """The matrices are 4x4 float64 arrays modified in place, the direction matrix keeping
+    its 3x3 part in the upper left. The matrix stacks are preallocated, one slot per index."""
     MATERIAL_COLOR_1_SHININESS_FLAG = 0x8000
+    MatrixStackSize = 31
 
     def __init__(self):
         self.TranslucentPass = False
@@ -135,71 +231,95 @@ class GeometryEngineState:
         
         self.MatrixMode = GxMtxMode.PositionVector
 
-        self._positionMatrixStack = [Matrix.Identity(4)] * 31
-        self._directionMatrixStack = [Matrix.Identity(3)] * 31
-        self._textureMatrixStack = Matrix.Identity(4)
+        self._positionMatrixStack = np.tile(np.identity(4), (self.MatrixStackSize, 1, 1))
+        self._directionMatrixStack = np.tile(np.identity(4), (self.MatrixStackSize, 1, 1))
+        self._textureMatrixStack = np.identity(4)
 
-        self.PositionMatrix = Matrix.Identity(4)
-        self.DirectionMatrix = Matrix.Identity(3)
-        self._textureMatrix = Matrix.Identity(4)
+        self.PositionMatrix = np.identity(4)
+        self.DirectionMatrix = np.identity(4)
+        self._textureMatrix = np.identity(4)
+        self._product = np.empty((4, 4))
 
-        self.TexCoord = Vector([0.0, 0.0])
+        self.TexCoord = np.zeros(2)
+    
+    def _TransformedMatrix(self):
+        """The matrix Translate and Scale apply to in the current mode, None if there is none."""
+        mode = self.MatrixMode
+        if mode is GxMtxMode.Position or mode is GxMtxMode.PositionVector:
+            return self.PositionMatrix
+        if mode is GxMtxMode.Texture:
+            return self._textureMatrix
+        return None
+    
+    def _LoadedMatrices(self):
+        """The matrices LoadMatrix and MultMatrix apply to in the current mode."""
+        mode = self.MatrixMode
+        if mode is GxMtxMode.PositionVector:
+            return (self.PositionMatrix, self.DirectionMatrix)
+        if mode is GxMtxMode.Position:
+            return (self.PositionMatrix,)
+        if mode is GxMtxMode.Texture:
+            return (self._textureMatrix,)
+        return ()
     
     def Translate(self, translation):
-        m = Matrix.Translation(translation)
-        if self.MatrixMode == GxMtxMode.Position or self.MatrixMode == GxMtxMode.PositionVector:
-            self.PositionMatrix @= m
-        if self.MatrixMode == GxMtxMode.Texture:
-            self._textureMatrix @= m
+        m = self._TransformedMatrix()
+        if m is not None:
+            m[:, 3] += m[:, 0] * translation[0] + m[:, 1] * translation[1] + m[:, 2] * translation[2]
     def Scale(self, scale):
-        m = Matrix.Scale(scale.x, 4, Vector((1, 0, 0))) @ \
-            Matrix.Scale(scale.y, 4, Vector((0, 1, 0))) @ \
-            Matrix.Scale(scale.z, 4, Vector((0, 0, 1)))
-        if self.MatrixMode == GxMtxMode.Position or self.MatrixMode == GxMtxMode.PositionVector:
-            self.PositionMatrix @= m
-        if self.MatrixMode == GxMtxMode.Texture:
-            self._textureMatrix @= m
+        m = self._TransformedMatrix()
+        if m is not None:
+            m[:, 0] *= scale[0]
+            m[:, 1] *= scale[1]
+            m[:, 2] *= scale[2]
     def LoadMatrix(self, mtx):
-        if self.MatrixMode == GxMtxMode.Position or self.MatrixMode == GxMtxMode.PositionVector:
-            self.PositionMatrix = mtx
-        if self.MatrixMode == GxMtxMode.PositionVector:
-            self.DirectionMatrix = mtx
-        if self.MatrixMode == GxMtxMode.Texture:
-            self._textureMatrix = mtx
+        mtx = np.asarray(mtx, dtype=np.float64)
+        for m in self._LoadedMatrices():
+            if mtx.shape == (3, 3):
+                m[...] = np.identity(4)
+                m[:3, :3] = mtx
+            else:
+                m[...] = mtx
     def MultMatrix(self, mtx):
-        if len(mtx.row) == 3 and len(mtx.col) == 3:
-            mtx = mtx.to_4x4()
-        if self.MatrixMode == GxMtxMode.Position or self.MatrixMode == GxMtxMode.PositionVector:
-            self.PositionMatrix @= mtx
-        if self.MatrixMode == GxMtxMode.PositionVector:
-            self.DirectionMatrix @= mtx
-        if self.MatrixMode == GxMtxMode.Texture:
-            self._textureMatrix @= mtx
+        mtx = np.asarray(mtx, dtype=np.float64)
+        for m in self._LoadedMatrices():
+            if mtx.shape == (3, 3):
+                np.matmul(m[:, :3], mtx, out=self._product[:, :3])
+                m[:, :3] = self._product[:, :3]
+            else:
+                np.matmul(m, mtx, out=self._product)
+                m[...] = self._product
+    def MultMatrix43(self, rows):
+        """Multiplies by a 4x3 matrix, given as 3 rotation rows followed by the translation."""
+        mtx = np.identity(4)
+        mtx[:3, :3] = [rows[0], rows[1], rows[2]]
+        mtx[:3, 3] = rows[3]
+        self.MultMatrix(mtx)
     def RestoreMatrix(self, index):
-        if self.MatrixMode == GxMtxMode.Position or self.MatrixMode == GxMtxMode.PositionVector:
-            self.PositionMatrix = self._positionMatrixStack[index]
-            self.DirectionMatrix = self._directionMatrixStack[index]
-        if self.MatrixMode == GxMtxMode.Texture:
-            self._textureMatrix = self._textureMatrixStack
+        if self.MatrixMode is GxMtxMode.Position or self.MatrixMode is GxMtxMode.PositionVector:
+            self.PositionMatrix[...] = self._positionMatrixStack[index]
+            self.DirectionMatrix[...] = self._directionMatrixStack[index]
+        if self.MatrixMode is GxMtxMode.Texture:
+            self._textureMatrix[...] = self._textureMatrixStack
     def StoreMatrix(self, index):
-        if self.MatrixMode == GxMtxMode.Position or self.MatrixMode == GxMtxMode.PositionVector:
+        if self.MatrixMode is GxMtxMode.Position or self.MatrixMode is GxMtxMode.PositionVector:
             self._positionMatrixStack[index] = self.PositionMatrix
             self._directionMatrixStack[index] = self.DirectionMatrix
-        if self.MatrixMode == GxMtxMode.Texture:
-            self._textureMatrixStack = self._textureMatrix
+        if self.MatrixMode is GxMtxMode.Texture:
+            self._textureMatrixStack[...] = self._textureMatrix
 
 class G3dModelRenderer:
-    def __init__(self):
+    def __init__(self, sink=None):
         self._geState = GeometryEngineState()
-        self._renderContext = RenderContext(self._geState)
+        self._renderContext = RenderContext(self._geState, sink)
         self.RenderObj = None
-        self.BaseScale = Vector([16.0, 16.0, 16.0])
-        self.MultMatrix = Matrix.Identity(4)
-        self.Scale = Vector([0.0, 0.0, 0.0])
+        self.BaseScale = np.full(3, 16.0)
+        self.MultMatrix = np.identity(4)
+        self.Scale = np.zeros(3)
     
     def Render(self):
-        self._renderContext.GlobalState.BaseTrans = Vector([0.0, 0.0, 0.0])
-        self._renderContext.GlobalState.BaseRot = Matrix.Identity(3)
+        self._renderContext.GlobalState.BaseTrans = np.zeros(3)
+        self._renderContext.GlobalState.BaseRot = np.identity(3)
         self._renderContext.GlobalState.BaseScale = self.BaseScale
         
         self._renderContext.GlobalState.FlushP(self._geState)
@@ -207,25 +327,93 @@ class G3dModelRenderer:
         self._renderContext.GeState.MultMatrix(self.MultMatrix)
         self._renderContext.GeState.Scale(self.Scale)
         
+        self.Sink.BeginModel(self.RenderObj.ModelResource)
         self._renderContext.Sbc.Draw(self.RenderObj)
+        self.Sink.EndModel()
+    
+    @property
+    def Sink(self):
+        return self._renderContext.Sink
+    
+    @Sink.setter
+    def Sink(self, sink):
+        self._renderContext.Sink = sink
+    
+    def Replay(self, cachedModel):
+        """Draws the shapes recorded in a cache entry, without walking the SBC. The geometry
+        engine gets back the matrices and material registers of every recorded draw, the
+        registers as ints and TexImageParam as a GxTexImageParam."""
+        shapes = self.RenderObj.ModelResource.Shapes.Shapes
+        draws = cachedModel.Draws
+        geState = self._geState
+        registers = zip(draws["MaterialColors0"].tolist(), draws["MaterialColors1"].tolist(),
+                        draws["PolygonAttrs"].tolist(), draws["TexImageParams"].tolist())
+        self.Sink.BeginModel(self.RenderObj.ModelResource)
+        for i, (shapeIndex, materialIndex, (color0, color1, polygonAttr, texImageParam)) in \
+                enumerate(zip(draws["ShapeIndices"].tolist(), draws["MaterialIndices"].tolist(), registers)):
+            geState.PositionMatrix[...] = draws["PositionMatrices"][i]
+            geState.DirectionMatrix[...] = draws["DirectionMatrices"][i]
+            geState.MaterialColor0 = color0
+            geState.MaterialColor1 = color1
+            geState.PolygonAttr = polygonAttr
+            geState.TexImageParam = GxTexImageParam(texImageParam) if texImageParam >= 0 else None
+            self._renderContext.RenderShp(shapeIndex, shapes[shapeIndex], self.RenderObj.ShapeProxies[shapeIndex], materialIndex)
+        self.Sink.EndModel()
 
 class ModelRenderGroup:
-    def __init__(self, nsbmd):
+    def __init__(self, nsbmd, modelIndex=0, cache=None, weld=False, quads=False, sink=None, modelManager=None):
+        """modelManager is a G3dModelManager shared with other groups, its weld and quads
+        options replacing the given ones."""
         self._renderer = None
+        self._sink = sink
         self._renderObj = None
-        self._modelManager = G3dModelManager()
+        self._modelManager = modelManager if modelManager is not None else G3dModelManager(weld, quads)
         self.nsbmd = nsbmd
         self.model = None
+        self.modelIndex = modelIndex
+        self.cache = cache
+        self._cacheKey = None
+        self._cachedModel = None
     
     def InitModel(self):
-        self._renderer = G3dModelRenderer()
-        self.model = self.nsbmd.ModelSet.Models[0]
+        self._renderer = G3dModelRenderer(self._sink)
+        self.model = self.nsbmd.ModelSet.Models[self.modelIndex]
         self._renderObj = G3dRenderObject(self.model)
-        self._modelManager.InitializeRenderObject(self._renderObj)
+        if self.cache is not None:
+            options = [name for name, enabled in (("weld", self._modelManager.Weld), ("quads", self._modelManager.Quads)) if enabled]
+            self._cacheKey = self.cache.GetFileKey(self.nsbmd.Data, options)
+            self._cachedModel = self.cache.Load(self._cacheKey, self.modelIndex)
+        # the buffers of a cache entry go through the manager too, to be shared with the other models
+        shapeProxies = self._cachedModel.ShapeProxies if self._cachedModel is not None else None
+        self._modelManager.InitializeRenderObject(self._renderObj, shapeProxies=shapeProxies)
+    
+    def Release(self):
+        """Gives the shape buffers back to the model manager, after the render."""
+        self._modelManager.ReleaseRenderObject(self._renderObj)
+    
+    @property
+    def WeldedVertexCount(self):
+        return sum(buffer.WeldedVertexCount for buffer in self._renderObj.ShapeProxies)
     
     def Render(self):
         self._renderer.RenderObj = self._renderObj
-        self._renderer.Render()
+        if self._cachedModel is not None:
+            self._renderer.Replay(self._cachedModel)
+            return
+        
+        if self.cache is None:
+            self._renderer.Render()
+            return
+        
+        # the draws are recorded on their way to the sink, for the next imports
+        sink = self._renderer.Sink
+        collector = CollectorSink(sink)
+        self._renderer.Sink = collector
+        try:
+            self._renderer.Render()
+        finally:
+            self._renderer.Sink = sink
+        self.cache.Store(self._cacheKey, self.modelIndex, self._renderObj.ShapeProxies, collector.GetArrays())
 
 #with open("./models/eff10355010.nsbmd", "rb") as file:
 #    nsbmd = Nsbmd(BytesIO(file.read()))
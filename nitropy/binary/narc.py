@@ -0,0 +1,139 @@
+from .nitro import *
+from struct import unpack_from
+from fnmatch import fnmatchcase
+
+from .. import compression
+
+def ReadFileNameTable(data, offset, fileCount):
+    """Walks a FNT (shared by NARC archives and NDS roms) and returns the path of every
+    file id below fileCount, None for the files the table does not name."""
+    paths = [None] * fileCount
+    directoryCount = unpack_from("<H", data, offset + 6)[0]
+
+    def Walk(directoryId, prefix):
+        if directoryId & 0xFFF >= directoryCount:
+            raise Exception(f"Invalid directory id in file name table : {directoryId:#x}")
+        subTableOffset, fileId = unpack_from("<IH", data, offset + (directoryId & 0xFFF) * 8)
+        pos = offset + subTableOffset
+        while True:
+            kind = data[pos]
+            pos += 1
+            if kind == 0:
+                break
+            length = kind & 0x7F
+            name = str(data[pos:pos + length], "shift-jis")
+            pos += length
+            if kind & 0x80:
+                subDirectoryId = unpack_from("<H", data, pos)[0]
+                pos += 2
+                Walk(subDirectoryId, prefix + name + "/")
+            else:
+                if fileId < fileCount:
+                    paths[fileId] = prefix + name
+                fileId += 1
+
+    Walk(0xF000, "")
+    return paths
+
+class NarcFile:
+    def __init__(self, archive, id, path, offset, size):
+        self._archive = archive
+        self.Id = id
+        self.Path = path
+        self.Offset = offset
+        self.Size = size
+
+    @property
+    def Name(self):
+        return self.Path if self.Path is not None else f"{self.Id:04d}"
+
+    @property
+    def RawData(self):
+        """The member as stored in the archive, without copy."""
+        return self._archive.Data[self.Offset:self.Offset + self.Size]
+
+    @property
+    def Data(self):
+        """The member content, decompressed if it is LZ10/LZ11 compressed."""
+        data = self.RawData
+        return compression.Decompress(data) if compression.IsCompressed(data) else data
+
+    @property
+    def Signature(self):
+        data = self.RawData
+        if compression.IsCompressed(data):
+            # the first flag block is enough to get the 4 first bytes
+            decompressor = compression.LzDecompressor()
+            decompressor.Feed(data[:0x40])
+            return bytes(decompressor.Output[:4]) if decompressor.Position >= 4 else bytes(self.Data[:4])
+        return bytes(data[:4])
+
+class NitroFileSystem:
+    """Lookups shared by the containers of named files (NARC archives, NDS roms).
+    Subclasses fill Files with NarcFile-like objects."""
+    def __len__(self):
+        return len(self.Files)
+
+    def __iter__(self):
+        return iter(self.Files)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            file = self.Find(key)
+            if file is None:
+                raise KeyError(key)
+            return file
+        return self.Files[key]
+
+    def Find(self, path):
+        if self._pathIndex is None:
+            self._pathIndex = {file.Path: file for file in self.Files if file.Path is not None}
+        return self._pathIndex.get(path)
+
+    def Glob(self, pattern):
+        return [file for file in self.Files if file.Path is not None and fnmatchcase(file.Path, pattern)]
+
+    def FindSignature(self, *signatures):
+        """Members whose (decompressed) content starts with one of signatures."""
+        return [file for file in self.Files if file.Size >= 4 and file.Signature in signatures]
+
+    def FindG3dFiles(self):
+        return self.FindSignature(*G3dSignatures)
+
+class Narc(NitroFileSystem):
+    def __init__(self, data):
+        data = ReadBuffer(data)
+        self.Data = data
+        if data[:4] != b"NARC":
+            raise Exception(f"Wrong signature, got : {bytes(data[:4])}, exepted : NARC")
+        headerSize = unpack_from("<H", data, 12)[0]
+
+        sections = {}
+        offset = headerSize
+        while offset + 8 <= len(data):
+            signature = bytes(data[offset:offset + 4])
+            size = unpack_from("<I", data, offset + 4)[0]
+            sections[signature] = offset
+            if size < 8:
+                break
+            offset += size
+        for signature in (b"BTAF", b"BTNF", b"GMIF"):
+            if signature not in sections:
+                raise Exception(f"Missing {signature} section in NARC")
+
+        fatOffset = sections[b"BTAF"]
+        fileCount = unpack_from("<H", data, fatOffset + 8)[0]
+        fat = unpack_from(f"<{fileCount * 2}I", data, fatOffset + 12)
+        paths = ReadFileNameTable(data, sections[b"BTNF"] + 8, fileCount)
+        imageOffset = sections[b"GMIF"] + 8
+
+        self.Files = [NarcFile(self, i, paths[i], imageOffset + fat[i * 2], fat[i * 2 + 1] - fat[i * 2])
+                      for i in range(fileCount)]
+        self._pathIndex = None
+
+    @staticmethod
+    def FromFile(filepath, useMmap=True):
+        return Narc(ReadBuffer(filepath, useMmap))
+
+    def __reduce__(self):
+        return (Narc, (bytes(self.Data),))
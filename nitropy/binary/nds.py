@@ -0,0 +1,60 @@
+from .nitro import *
+from .narc import *
+from struct import unpack_from
+
+class NdsFile(NarcFile):
+    @property
+    def Name(self):
+        # the files the FNT does not name are the arm9/arm7 overlays
+        return self.Path if self.Path is not None else f"overlay/{self.Id:04d}"
+
+class NdsRom(NitroFileSystem):
+    """The filesystem of a .nds rom, read straight from the (memory mapped) rom."""
+    def __init__(self, data):
+        data = ReadBuffer(data)
+        self.Data = data
+        if len(data) < 0x200:
+            raise Exception("File too small to be a NDS rom.")
+        self.Title = bytes(data[0:12]).rstrip(b"\0").decode("ascii", "replace")
+        self.GameCode = bytes(data[12:16]).decode("ascii", "replace")
+        fntOffset, fntSize, fatOffset, fatSize = unpack_from("<4I", data, 0x40)
+        if fatOffset + fatSize > len(data) or fntOffset + fntSize > len(data):
+            raise Exception("FNT/FAT outside of the rom, not a NDS rom ?")
+
+        fileCount = fatSize // 8
+        fat = unpack_from(f"<{fileCount * 2}I", data, fatOffset)
+        paths = ReadFileNameTable(data, fntOffset, fileCount)
+
+        self.Files = [NdsFile(self, i, paths[i], fat[i * 2], fat[i * 2 + 1] - fat[i * 2])
+                      for i in range(fileCount)]
+        self._pathIndex = None
+
+    @staticmethod
+    def FromFile(filepath, useMmap=True):
+        return NdsRom(ReadBuffer(filepath, useMmap))
+
+    def __reduce__(self):
+        return (NdsRom, (bytes(self.Data),))
+
+    def ScanG3dFiles(self, searchArchives=True, signatures=G3dSignatures, errors=None):
+        """Yields (path, file) for every G3d file of the rom whose signature is one of
+        signatures. With searchArchives the members of NARC archives are searched too, their
+        path being the archive path followed by the member name. The archives that can not
+        be read are skipped, with errors (a list) getting their (path, message)."""
+        for file in self.Files:
+            if file.Size < 4:
+                continue
+            signature = file.Signature
+            if signature in signatures:
+                yield file.Name, file
+                continue
+            if not searchArchives or signature != b"NARC":
+                continue
+            try:
+                archive = Narc(file.Data)
+            except Exception as e:
+                if errors is not None:
+                    errors.append((file.Name, f"{type(e).__name__}: {e}"))
+                continue
+            for member in archive.FindSignature(*signatures):
+                yield f"{file.Name}/{member.Name}", member
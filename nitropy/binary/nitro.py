@@ -1,84 +1,205 @@
 from struct import unpack, unpack_from, Struct, calcsize, pack
-from mathutils import Matrix, Vector
+import numpy as np
 import math
+import mmap
 from enum import Enum
+from functools import lru_cache
+from .. import compression
+from .layout import *
 
-def ReadSignature(reader, expected):
-    signature = unpack("<I", reader.read(4))[0]
+def ReadBuffer(source, useMmap=False):
+    """Returns the whole content of a path or file object as a memoryview.
+    The file handle is closed before returning, with useMmap the mapping stays alive
+    as long as the view (or any slice of it) is referenced.
+    LZ10/LZ11 compressed content is detected and decompressed."""
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return compression.Decompress(source) if compression.IsCompressed(source) else memoryview(source)
+    if hasattr(source, "read"):
+        return ReadStream(source)
+    with open(source, "rb") as file:
+        if useMmap:
+            data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            return compression.Decompress(data) if compression.IsCompressed(data) else data
+        return ReadStream(file)
+
+def ReadStream(file):
+    start = file.tell()
+    header = file.read(8)
+    if compression.IsCompressed(header):
+        return compression.DecompressStream(file, header)
+    file.seek(start)
+    return memoryview(file.read())
+
+# The parsed objects keep views of the file buffer, which pickle can not handle. The files
+# (Nsbmd, Narc, NdsRom) and the models pickle as a copy of their bytes and are parsed again
+# from it when loaded, everything parsed from them sharing that copy. The other objects
+# holding views (ViewPickling) pickle a copy of every view they hold.
+class CopiedView(bytes):
+    """The content of a memoryview copied for pickling, RestoreViews makes it a view again."""
+
+def CopyViews(value):
+    """value with its memoryviews, also those in lists, tuples and dicts, copied."""
+    if isinstance(value, memoryview):
+        return CopiedView(value)
+    if isinstance(value, list):
+        return [CopyViews(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(CopyViews(item) for item in value)
+    if isinstance(value, dict):
+        return {key: CopyViews(item) for key, item in value.items()}
+    return value
+
+def RestoreViews(value):
+    if isinstance(value, CopiedView):
+        return memoryview(value)
+    if isinstance(value, list):
+        return [RestoreViews(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(RestoreViews(item) for item in value)
+    if isinstance(value, dict):
+        return {key: RestoreViews(item) for key, item in value.items()}
+    return value
+
+class ViewPickling:
+    """Pickles the memoryviews held by the instance attributes as copies of their content."""
+    def __getstate__(self):
+        return CopyViews(self.__dict__)
+    
+    def __setstate__(self, state):
+        self.__dict__.update(RestoreViews(state))
+
+G3dSignatures = (b"BMD0", b"BTX0", b"BCA0", b"BTA0", b"BTP0", b"BMA0", b"BVA0")
+
+def ReadSignature(data, offset, expected):
+    signature = unpack_from("<I", data, offset)[0]
     if signature != expected:
         raise Exception(f"Expected signature : {expected}, got : {signature}")
     return signature
 
 class G3dFileHeader:
-    def __init__(self, reader, expectedSignature):
-        self.Signature, self.ByteOrder, self.Version, self.FileSize, self.HeaderSize, self.NrBlocks = \
-            unpack("<IHHIHH", reader.read(16))
+    Layout = RecordLayout(
+        Field("Signature", "u32"),
+        Field("ByteOrder", "u16"),
+        Field("Version", "u16"),
+        Field("FileSize", "u32"),
+        Field("HeaderSize", "u16"),
+        Field("NrBlocks", "u16"),
+    )
+    
+    def __init__(self, data, offset, expectedSignature):
+        offset += self.Layout.ReadInto(self, data, offset)
         if self.Signature != expectedSignature:
             raise Exception(f"Expected signature : {expectedSignature}, got : {self.Signature}")
-        self.BlockOffsets = [unpack("<I", reader.read(4))[0] for i in range(self.NrBlocks)]
+        self.BlockOffsets = list(unpack_from(f"<{self.NrBlocks}I", data, offset))
+
+@lru_cache(maxsize=4096)
+def DecodeName(rawName):
+    return rawName.rstrip(b"\0").decode("shift-jis")
+
+def EncodeName(name):
+    return name.encode("shift-jis") if isinstance(name, str) else bytes(name).rstrip(b"\0")
 
 class G3dDictionary:
-    def __init__(self, reader, TData):
+    def __init__(self, data, offset, TData):
         self.Data = []
-        G3dDictionarySerializer.ReadG3dDictionary(reader, self, TData)
+        self._index = None
+        G3dDictionarySerializer.ReadG3dDictionary(data, offset, self, TData)
     
     def Add(self, name, data):
         self.Data.append(G3dDictionaryEntry(name, data))
+        self._index = None
+    
+    def IndexOf(self, name):
+        """Index of the entry named name (str or raw bytes), -1 if there is none.
+        The name index is built on the first lookup, names are never decoded for it."""
+        if self._index is None:
+            self._index = {}
+            for i, entry in enumerate(self.Data):
+                self._index.setdefault(entry.RawName, i)
+        try:
+            rawName = EncodeName(name)
+        except UnicodeEncodeError:
+            # a name shift-jis can not encode is the name of no entry
+            return -1
+        return self._index.get(rawName, -1)
+    
+    def Find(self, name):
+        index = self.IndexOf(name)
+        return self.Data[index] if index >= 0 else None
+    
+    def __contains__(self, name):
+        return self.IndexOf(name) >= 0
+    
+    def __getitem__(self, key):
+        if isinstance(key, (str, bytes)):
+            index = self.IndexOf(key)
+            if index < 0:
+                raise KeyError(key)
+            return self.Data[index]
+        return self.Data[key]
     
     def __len__(self):
         return len(self.Data)
 
 class G3dDictionaryEntry:
     def __init__(self, name, data):
-        self.Name = name
+        self.RawName = EncodeName(name)
         self.Data = data
+    
+    @property
+    def Name(self):
+        return DecodeName(self.RawName)
 
 class G3dDictionarySerializer:
+    HeaderLayout = RecordLayout(
+        Field("Revision", "u8"),
+        Field("EntryCount", "u8"),
+        Field("DictionarySize", "u16"),
+        Padding(2),
+        Field("EntriesOffset", "u16"),
+    )
+    EntriesHeaderLayout = RecordLayout(
+        Field("EntrySize", "u16"),
+        Field("NamesOffset", "u16"),
+    )
+    
     @staticmethod
-    def ReadG3dDictionary(reader, dictionary, TData):
-        startPosition = reader.tell()
-        revision = unpack("<B", reader.read(1))[0]
-        entryCount = unpack("<B", reader.read(1))[0]
-        dictionarySize = unpack("<H", reader.read(2))[0]
-        reader.read(2)
-        entriesOffset = unpack("<H", reader.read(2))[0]
+    def ReadG3dDictionary(data, offset, dictionary, TData):
+        revision, entryCount, dictionarySize, entriesOffset = G3dDictionarySerializer.HeaderLayout.Read(data, offset)
         if revision != 0:
             raise Exception(f"Unsupported dictionary revision. Got {revision}, expected 0.")
-        reader.seek(startPosition + entriesOffset)
-        entrySize = unpack("<H", reader.read(2))[0]
-        namesOffset = unpack("<H", reader.read(2))[0]
+        entrySize, namesOffset = G3dDictionarySerializer.EntriesHeaderLayout.Read(data, offset + entriesOffset)
         if entrySize != TData.DataSize:
             raise Exception(f"Dictionary entry size mismatch. Got {entrySize}, expected {TData.DataSize}.")
-        data = [TData(reader) for i in range(entryCount)]
-        reader.seek(startPosition + entriesOffset + namesOffset)
+        dataOffset = offset + entriesOffset + 4
+        items = [TData(data, dataOffset + i * entrySize) for i in range(entryCount)]
+        namesOffset += offset + entriesOffset
         for i in range(entryCount):
-            name = reader.read(16).decode("shift-jis")
-            dictionary.Add(name, data[i])
-        reader.seek(startPosition + dictionarySize)
+            dictionary.Add(data[namesOffset + i * 16:namesOffset + (i + 1) * 16], items[i])
 
 class OffsetDictionaryData:
     DataSize = 4
-    def __init__(self, reader):
-        self.Offset = unpack("<I", reader.read(4))[0]
-class TextureToMaterialDictionaryData:
+    def __init__(self, data, offset):
+        self.Offset = unpack_from("<I", data, offset)[0]
+class TextureToMaterialDictionaryData(ViewPickling):
     DataSize = 4
-    def __init__(self, reader):
+    def __init__(self, data, offset):
         self.Materials = []
-        self.flags = unpack("<I", reader.read(4))[0]
+        self.flags = unpack_from("<I", data, offset)[0]
         self.Offset = self.flags & 0xFFFF
         self.MaterialCount = self.flags >> 16 & 0x7F
         self.Bound = self.flags >> 24 & 0xFF
-class PaletteToMaterialDictionaryData:
+class PaletteToMaterialDictionaryData(ViewPickling):
     DataSize = 4
-    def __init__(self, reader):
+    def __init__(self, data, offset):
         self.Materials = []
-        self.flags = unpack("<I", reader.read(4))[0]
+        self.flags = unpack_from("<I", data, offset)[0]
         self.Offset = self.flags & 0xFFFF
         self.MaterialCount = self.flags >> 16 & 0x7F
         self.Bound = self.flags >> 24 & 0xFF
 class TextureDictionaryData:
     DataSize = 8
-    def __init__(self, reader):
+    def __init__(self, data, offset):
         ParamExOrigWMask = 0x000007ff
         ParamExOrigHMask = 0x003ff800
         ParamExWHSameMask = 0x80000000
@@ -86,13 +207,12 @@ class TextureDictionaryData:
         ParamExOrigHShift = 11
         ParamExWHSameShift = 31
         
-        self.TexImageParam = GxTexImageParam(unpack("<I", reader.read(4))[0])
-        self.ExtraParam = unpack("<I", reader.read(4))[0]
+        texImageParam, self.ExtraParam = unpack_from("<II", data, offset)
+        self.TexImageParam = GxTexImageParam(texImageParam)
 class PaletteDictionaryData:
     DataSize = 4
-    def __init__(self, reader):
-        self.Offset = unpack("<H", reader.read(2))[0]
-        self.Flags = unpack("<H", reader.read(2))[0]
+    def __init__(self, data, offset):
+        self.Offset, self.Flags = unpack_from("<HH", data, offset)
 
 class G3dConfig:
     MaxJointCount = 64
@@ -112,6 +232,9 @@ class GxPolygonAttr:
         self.FogEnable: bool = (self._value & (1 << 15)) != 0
         self.Alpha = (self._value >> 16) & 0x1F
         self.PolygonId = (self._value >> 24) & 0x3F
+    
+    def __int__(self):
+        return self._value
 
 class GxTexImageParam:
     def __init__(self, value):
@@ -126,6 +249,9 @@ class GxTexImageParam:
         self.Format = ImageFormat((self._value >> 26) & 7)
         self.Color0Transparent: bool = (self._value & (1 << 29)) != 0
         self.TexGen = GxTexGen((self._value >> 30) & 3)
+    
+    def __int__(self):
+        return self._value
 
 class GxPolygonMode(Enum):
     Modulate      = 0
@@ -224,19 +350,19 @@ class Rgba8Bitmap:
     #    image.save(filepath)
 
 
-def ReadFx16(reader):
-    return unpack("<h", reader.read(2))[0] / 4096.0
-def ReadFx16s(reader, count):
-    return [ReadFx16(reader) for i in range(count)]
-def ReadVecFx16(reader):
-    return [ReadFx16(reader) for i in range(3)]
+def ReadFx16(data, offset):
+    return unpack_from("<h", data, offset)[0] / 4096.0
+def ReadFx16s(data, offset, count):
+    return [v / 4096.0 for v in unpack_from(f"<{count}h", data, offset)]
+def ReadVecFx16(data, offset):
+    return ReadFx16s(data, offset, 3)
 FX32_SHIFT = 12
-def ReadFx32(reader):
-    return unpack("<i", reader.read(4))[0] / 4096.0
-def ReadFx32s(reader, count):
-    return [ReadFx32(reader) for i in range(count)]
-def ReadVecFx32(reader):
-    return [ReadFx32(reader) for i in range(3)]
+def ReadFx32(data, offset):
+    return unpack_from("<i", data, offset)[0] / 4096.0
+def ReadFx32s(data, offset, count):
+    return [v / 4096.0 for v in unpack_from(f"<{count}i", data, offset)]
+def ReadVecFx32(data, offset):
+    return ReadFx32s(data, offset, 3)
 
 PivotUtil = [
     [4, 5, 7, 8],
@@ -305,23 +431,20 @@ class Si3d:
             context.GeState.Scale(animationResult.ScaleEx1)
         if not animationResult.Flag & JointAnimationResultFlag.TranslationZero:
             if not flagScaleEx:
-                tmp = Vector([
-                animationResult.Translation.x * animationResult.ScaleEx0.x,
-                animationResult.Translation.y * animationResult.ScaleEx0.y,
-                animationResult.Translation.z * animationResult.ScaleEx0.z])
+                tmp = np.multiply(animationResult.Translation, animationResult.ScaleEx0)
                 context.GeState.Translate(tmp)
             else:
                 trFlag = True
         if not animationResult.Flag & JointAnimationResultFlag.RotationZero:
             if trFlag:
-                context.GeState.MultMatrix(Matrix([
+                context.GeState.MultMatrix43([
                     animationResult.Rotation[0], animationResult.Rotation[1], animationResult.Rotation[2],
-                    animationResult.Translation]))
+                    animationResult.Translation])
             else:
                 context.GeState.MultMatrix(animationResult.Rotation)
         else:
             if trFlag:
-                context.GeState.Translation(animationResult.Translation)
+                context.GeState.Translate(animationResult.Translation)
         if not flagScaleEx:
             context.GeState.Scale(animationResult.ScaleEx0)
         if not animationResult.Flag & JointAnimationResultFlag.ScaleOne:
@@ -349,18 +472,10 @@ class Si3d:
             else:
                 context.RenderState.IsScaleCacheOne[nodeId] = False
                 
-                context.GlobalRenderState.ScaleCache[nodeId].Scale.x = \
-                    nodeData.Scale.x * context.GlobalRenderState.ScaleCache[parentId].Scale.x
-                context.GlobalRenderState.ScaleCache[nodeId].Scale.y = \
-                    nodeData.Scale.y * context.GlobalRenderState.ScaleCache[parentId].Scale.y
-                context.GlobalRenderState.ScaleCache[nodeId].Scale.z = \
-                    nodeData.Scale.z * context.GlobalRenderState.ScaleCache[parentId].Scale.z
-                context.GlobalRenderState.ScaleCache[nodeId].InverseScale.x = \
-                    nodeData.InverseScale.x * context.GlobalRenderState.ScaleCache[parentId].InverseScale.x
-                context.GlobalRenderState.ScaleCache[nodeId].InverseScale.y = \
-                    nodeData.InverseScale.y * context.GlobalRenderState.ScaleCache[parentId].InverseScale.y
-                context.GlobalRenderState.ScaleCache[nodeId].InverseScale.z = \
-                    nodeData.InverseScale.z * context.GlobalRenderState.ScaleCache[parentId].InverseScale.z
+                context.GlobalRenderState.ScaleCache[nodeId].Scale = \
+                    np.multiply(nodeData.Scale, context.GlobalRenderState.ScaleCache[parentId].Scale)
+                context.GlobalRenderState.ScaleCache[nodeId].InverseScale = \
+                    np.multiply(nodeData.InverseScale, context.GlobalRenderState.ScaleCache[parentId].InverseScale)
                 
                 context.GlobalRenderState.ScaleCache[parentId].Scale = animationResult.ScaleEx0
                 context.GlobalRenderState.ScaleCache[parentId].InverseScale = animationResult.ScaleEx1
@@ -410,18 +525,18 @@ class MaterialAnimationResult:
 class JointAnimationResult:
     def __init__(self):
         self.Flag = 0
-        self.Scale = Vector([0.0, 0.0, 0.0])
-        self.ScaleEx0 = Vector([0.0, 0.0, 0.0])
-        self.ScaleEx1 = Vector([0.0, 0.0, 0.0])
-        self.Rotation = Matrix([[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
-        self.Translation = Vector([0.0, 0.0, 0.0])
+        self.Scale = np.zeros(3)
+        self.ScaleEx0 = np.zeros(3)
+        self.ScaleEx1 = np.zeros(3)
+        self.Rotation = np.zeros((3, 3))
+        self.Translation = np.zeros(3)
     def Clear(self):
         self.Flag = 0
-        self.Scale = Vector([0.0, 0.0, 0.0])
-        self.ScaleEx0 = Vector([0.0, 0.0, 0.0])
-        self.ScaleEx1 = Vector([0.0, 0.0, 0.0])
-        self.Rotation = Matrix([[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
-        self.Translation = Vector([0.0, 0.0, 0.0])
+        self.Scale = np.zeros(3)
+        self.ScaleEx0 = np.zeros(3)
+        self.ScaleEx1 = np.zeros(3)
+        self.Rotation = np.zeros((3, 3))
+        self.Translation = np.zeros(3)
 class VisibilityAnimationResult:
     def __init__(self):
         self.IsVisible = False
@@ -1,121 +1,235 @@
 from .nitro import *
+from . import displaylist, sbc
 from struct import unpack, unpack_from, calcsize
 from io import BytesIO
 from enum import Enum
-from mathutils import Matrix, Vector
+import numpy as np
 
 class Nsbmd:
-    def __init__(self, reader):
-        self.Header = G3dFileHeader(reader, 0x30444D42)
+    def __init__(self, data):
+        data = ReadBuffer(data)
+        self.Data = data
+        self.Header = G3dFileHeader(data, 0, 0x30444D42)
         if self.Header.NrBlocks > 0:
-            reader.seek(self.Header.BlockOffsets[0])
-            self.ModelSet = G3dModelSet(reader)
+            self.ModelSet = G3dModelSet(data, self.Header.BlockOffsets[0])
+    
+    @staticmethod
+    def FromFile(filepath, useMmap=False):
+        return Nsbmd(ReadBuffer(filepath, useMmap))
+    
+    def __reduce__(self):
+        return (Nsbmd, (bytes(self.Data),))
+    
+    def Validate(self):
+        """Checks every model without decoding its geometry, returns the problems found."""
+        problems = []
+        if self.Header.NrBlocks == 0:
+            return problems
+        for i, entry in enumerate(self.ModelSet.Dictionary.Data):
+            try:
+                problems += [f"Model {entry.Name} : {problem}" for problem in self.ModelSet.Models[i].Validate()]
+            except Exception as e:
+                problems.append(f"Model {entry.Name} : {type(e).__name__}: {e}")
+        return problems
 
 class G3dModelSet:
-    def __init__(self, reader):
-        BeginChunk = reader.tell()
-        
-        signature = reader.read(4)
+    def __init__(self, data, offset):
+        signature = data[offset:offset + 4]
         if signature != b"MDL0":
-            raise Exception(f"Wrong signature, got : {signature}, exepted : MDL0")
-        sectionSize = unpack("<I", reader.read(4))[0]
-        self.Dictionary = G3dDictionary(reader, OffsetDictionaryData)
-        self.Models = []
-        for i in range(len(self.Dictionary)):
-            reader.seek(BeginChunk + self.Dictionary.Data[i].Data.Offset)
-            self.Models.append(G3dModel(reader))
+            raise Exception(f"Wrong signature, got : {bytes(signature)}, exepted : MDL0")
+        sectionSize = unpack_from("<I", data, offset + 4)[0]
+        self.Dictionary = G3dDictionary(data, offset + 8, OffsetDictionaryData)
+        self.Models = G3dModelList(data, offset, self.Dictionary)
+
+class G3dModelList(ViewPickling):
+    """Sequence of the models of a G3dModelSet, indexable by position or by dictionary name.
+    A model is only parsed the first time it is accessed."""
+    def __init__(self, data, offset, dictionary):
+        self._data = data
+        self._offset = offset
+        self._dictionary = dictionary
+        self._models = [None] * len(dictionary)
+    
+    def __len__(self):
+        return len(self._models)
+    
+    def __iter__(self):
+        for i in range(len(self._models)):
+            yield self[i]
+    
+    def __contains__(self, name):
+        return self.IndexOf(name) >= 0
+    
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(len(self._models))[key]]
+        if isinstance(key, (str, bytes)):
+            index = self.IndexOf(key)
+            if index < 0:
+                raise KeyError(key)
+        else:
+            index = range(len(self._models))[key]
+        if self._models[index] is None:
+            self._models[index] = G3dModel(self._data, self._offset + self._dictionary.Data[index].Data.Offset)
+        return self._models[index]
+    
+    def IndexOf(self, name):
+        return self._dictionary.IndexOf(name)
 
 class G3dModel:
-    def __init__(self, reader):
-        BeginChunk = reader.tell()
-        
-        Size = unpack("<I", reader.read(4))[0]
-        self.SbcOffset = unpack("<I", reader.read(4))[0]
-        MaterialsOffset = unpack("<I", reader.read(4))[0]
-        ShapesOffset = unpack("<I", reader.read(4))[0]
-        EnvelopeMatricesOffset = unpack("<I", reader.read(4))[0]
-        self.Info = G3dModelInfo(reader)
-        self.Nodes = G3dNodeSet(reader)
-        reader.seek(BeginChunk + self.SbcOffset)
-        self.Sbc = reader.read(MaterialsOffset - self.SbcOffset)
-        reader.seek(BeginChunk + MaterialsOffset)
-        self.Materials = G3dMaterialSet(reader)
-        reader.seek(BeginChunk + ShapesOffset)
-        self.Shapes = G3dShapeSet(reader)
-        self.EnvelopeMatrices = None
-        if EnvelopeMatricesOffset != Size and EnvelopeMatricesOffset != 0:
-            reader.seek(EnvelopeMatricesOffset + BeginChunk)
-            self.EnvelopeMatrices = G3dEnvelopeMatrices(reader, len(self.Nodes.NodeDictionary))
+    HeaderLayout = RecordLayout(
+        Field("Size", "u32"),
+        Field("SbcOffset", "u32"),
+        Field("MaterialsOffset", "u32"),
+        Field("ShapesOffset", "u32"),
+        Field("EnvelopeMatricesOffset", "u32"),
+    )
+    
+    def __init__(self, data, offset):
+        self._data = data
+        self._offset = offset
+        self.Size, self.SbcOffset, self._materialsOffset, self._shapesOffset, self._envelopeMatricesOffset = \
+            self.HeaderLayout.Read(data, offset)
+        self.Info = G3dModelInfo(data, offset + self.HeaderLayout.GetSize())
+        self.Sbc = data[offset + self.SbcOffset:offset + self._materialsOffset]
+        self._hasEnvelopeMatrices = self._envelopeMatricesOffset != self.Size and self._envelopeMatricesOffset != 0
+        self._nodes = None
+        self._materials = None
+        self._shapes = None
+        self._envelopeMatrices = None
+        self._sbcProgram = None
+    
+    def __reduce__(self):
+        # the offsets of a model are relative to its header, it is parsed again from its own bytes
+        return (G3dModel, (bytes(self._data[self._offset:self._offset + self.Size]), 0))
+    
+    @property
+    def SbcProgram(self):
+        """The Sbc compiled on first use, kept for the next draws of the model."""
+        if self._sbcProgram is None:
+            self._sbcProgram = sbc.SbcProgram(self.Sbc)
+        return self._sbcProgram
+    
+    @property
+    def Nodes(self):
+        if self._nodes is None:
+            self._nodes = G3dNodeSet(self._data, self._nodesOffset)
+        return self._nodes
+    
+    @property
+    def _nodesOffset(self):
+        return self._offset + self.HeaderLayout.GetSize() + G3dModelInfo.Layout.GetSize()
+    
+    def GetNodeNames(self):
+        """Reads only the node dictionary, not the nodes."""
+        return [entry.Name for entry in G3dDictionary(self._data, self._nodesOffset, OffsetDictionaryData).Data]
+    
+    def GetMaterialNames(self):
+        """Returns the (material, texture, palette) names, reading only the dictionaries of
+        the material set."""
+        dictionaries = G3dMaterialSet.ReadDictionaries(self._data, self._offset + self._materialsOffset)
+        return tuple([entry.Name for entry in dictionary.Data] for dictionary in dictionaries)
+    
+    @property
+    def Materials(self):
+        if self._materials is None:
+            self._materials = G3dMaterialSet(self._data, self._offset + self._materialsOffset)
+        return self._materials
+    
+    @property
+    def Shapes(self):
+        if self._shapes is None:
+            self._shapes = G3dShapeSet(self._data, self._offset + self._shapesOffset)
+        return self._shapes
+    
+    def Validate(self):
+        """Runs the display list pre-pass of every shape, returns the problems found."""
+        problems = []
+        for entry, shape in zip(self.Shapes.ShapeDictionary.Data, self.Shapes.Shapes):
+            problems += [f"Shape {entry.Name} : {error}" for error in displaylist.DisplayListInfo(shape.DisplayList).Validate()]
+        return problems
+    
+    @property
+    def EnvelopeMatrices(self):
+        if self._envelopeMatrices is None and self._hasEnvelopeMatrices:
+            self._envelopeMatrices = G3dEnvelopeMatrices(self._data, self._offset + self._envelopeMatricesOffset,
+                                                         len(self.Nodes.NodeDictionary))
+        return self._envelopeMatrices
 
 class G3dModelInfo:
-    def __init__(self, reader):
-        BeginChunk = reader.tell()
-        
-        self.SbcType = unpack("<B", reader.read(1))[0]
-        self.ScalingRule = unpack("<B", reader.read(1))[0]
-        #print(self.ScalingRule)
-        self.TextureMatrixMode = unpack("<B", reader.read(1))[0]
-        self.NodeCount = unpack("<B", reader.read(1))[0]
-        self.MaterialCount = unpack("<B", reader.read(1))[0]
-        self.ShapeCount = unpack("<B", reader.read(1))[0]
-        self.FirstUnusedMatrixStackId = unpack("<B", reader.read(1))[0]
-        reader.read(1) #dummy
-        self.PosScale, self.InversePosScale = ReadFx32s(reader, 2)
-        self.VertexCount = unpack("<H", reader.read(2))[0]
-        self.PolygonCount = unpack("<H", reader.read(2))[0]
-        self.TriangleCount = unpack("<H", reader.read(2))[0]
-        self.QuadCount = unpack("<H", reader.read(2))[0]
-        self.BoxX, self.BoxY, self.BoxZ = ReadFx16s(reader, 3)
-        self.BoxW, self.BoxH, self.BoxD = ReadFx16s(reader, 3)
-        self.BoxPosScale, self.BoxInversePosScale = ReadFx32s(reader, 2)
+    Layout = RecordLayout(
+        Field("SbcType", "u8"),
+        Field("ScalingRule", "u8"),
+        Field("TextureMatrixMode", "u8"),
+        Field("NodeCount", "u8"),
+        Field("MaterialCount", "u8"),
+        Field("ShapeCount", "u8"),
+        Field("FirstUnusedMatrixStackId", "u8"),
+        Padding(1),
+        Field("PosScale", "fx32"),
+        Field("InversePosScale", "fx32"),
+        Field("VertexCount", "u16"),
+        Field("PolygonCount", "u16"),
+        Field("TriangleCount", "u16"),
+        Field("QuadCount", "u16"),
+        Field("BoxX", "fx16"),
+        Field("BoxY", "fx16"),
+        Field("BoxZ", "fx16"),
+        Field("BoxW", "fx16"),
+        Field("BoxH", "fx16"),
+        Field("BoxD", "fx16"),
+        Field("BoxPosScale", "fx32"),
+        Field("BoxInversePosScale", "fx32"),
+    )
+    
+    def __init__(self, data, offset):
+        self.Layout.ReadInto(self, data, offset)
 
 class G3dNodeSet:
-    def __init__(self, reader):
-        BeginChunk = reader.tell()
-        self.NodeDictionary = G3dDictionary(reader, OffsetDictionaryData)
+    def __init__(self, data, offset):
+        self.NodeDictionary = G3dDictionary(data, offset, OffsetDictionaryData)
         self.Data = []
-        curpos = reader.tell()
         for i in range(len(self.NodeDictionary)):
-            reader.seek(BeginChunk + self.NodeDictionary.Data[i].Data.Offset)
-            self.Data.append(G3dNodeData(reader))
-        reader.seek(curpos)
+            self.Data.append(G3dNodeData(data, offset + self.NodeDictionary.Data[i].Data.Offset))
 
 class G3dNodeData:
-    def __init__(self, reader):
-        self.FLAGS_TRANSLATION_ZERO = 0x0001
-        self.FLAGS_ROTATION_ZERO = 0x0002
-        self.FLAGS_SCALE_ONE = 0x0004
-        self.FLAGS_ROTATION_PIVOT = 0x0008
-        self.FLAGS_ROTATION_PIVOT_INDEX_MASK = 0x00F0
-        self.FLAGS_ROTATION_PIVOT_INDEX_SHIFT = 4
-        self.FLAGS_ROTATION_PIVOT_NEGATIVE = 0x0100
-        self.FLAGS_ROTATION_PIVOT_SIGN_REVERSE_C = 0x0200
-        self.FLAGS_ROTATION_PIVOT_SIGN_REVERSE_D = 0x0400
-        self.FLAGS_MATRIX_STACK_INDEX_MASK = 0xF800
-        self.FLAGS_MATRIX_STACK_INDEX_SHIFT = 11
-        self.FLAGS_IDENTITY = self.FLAGS_TRANSLATION_ZERO | self.FLAGS_ROTATION_ZERO | self.FLAGS_SCALE_ONE
-        
-        self.Flags = unpack("<H", reader.read(2))[0]
-        
-        self._00 = ReadFx16(reader)
-        
-        if (self.Flags & self.FLAGS_TRANSLATION_ZERO) == 0:
-            self.Translation = Vector(ReadVecFx32(reader))
-        if (self.Flags & self.FLAGS_ROTATION_ZERO) == 0 and (self.Flags & self.FLAGS_ROTATION_PIVOT) == 0:
-            self._01 = ReadFx16(reader)
-            self._02 = ReadFx16(reader)
-            self._10 = ReadFx16(reader)
-            self._11 = ReadFx16(reader)
-            self._12 = ReadFx16(reader)
-            self._20 = ReadFx16(reader)
-            self._21 = ReadFx16(reader)
-            self._22 = ReadFx16(reader)
-        if (self.Flags & self.FLAGS_ROTATION_ZERO) == 0 and (self.Flags & self.FLAGS_ROTATION_PIVOT) != 0:
-            self.A = ReadFx16(reader)
-            self.B = ReadFx16(reader)
-        if (self.Flags & self.FLAGS_SCALE_ONE) == 0:
-            self.Scale = Vector(ReadVecFx32(reader))
-            self.InverseScale = Vector(ReadVecFx32(reader))
+    FLAGS_TRANSLATION_ZERO = 0x0001
+    FLAGS_ROTATION_ZERO = 0x0002
+    FLAGS_SCALE_ONE = 0x0004
+    FLAGS_ROTATION_PIVOT = 0x0008
+    FLAGS_ROTATION_PIVOT_INDEX_MASK = 0x00F0
+    FLAGS_ROTATION_PIVOT_INDEX_SHIFT = 4
+    FLAGS_ROTATION_PIVOT_NEGATIVE = 0x0100
+    FLAGS_ROTATION_PIVOT_SIGN_REVERSE_C = 0x0200
+    FLAGS_ROTATION_PIVOT_SIGN_REVERSE_D = 0x0400
+    FLAGS_MATRIX_STACK_INDEX_MASK = 0xF800
+    FLAGS_MATRIX_STACK_INDEX_SHIFT = 11
+    FLAGS_IDENTITY = FLAGS_TRANSLATION_ZERO | FLAGS_ROTATION_ZERO | FLAGS_SCALE_ONE
+    
+    Layout = RecordLayout(
+        Field("Flags", "u16"),
+        Field("_00", "fx16"),
+        OptionalFields(
+            Field("Translation", "fx32", 3),
+            whenClear=FLAGS_TRANSLATION_ZERO),
+        OptionalFields(
+            Field("_01", "fx16"), Field("_02", "fx16"),
+            Field("_10", "fx16"), Field("_11", "fx16"), Field("_12", "fx16"),
+            Field("_20", "fx16"), Field("_21", "fx16"), Field("_22", "fx16"),
+            whenClear=FLAGS_ROTATION_ZERO | FLAGS_ROTATION_PIVOT),
+        OptionalFields(
+            Field("A", "fx16"),
+            Field("B", "fx16"),
+            whenClear=FLAGS_ROTATION_ZERO, whenSet=FLAGS_ROTATION_PIVOT),
+        OptionalFields(
+            Field("Scale", "fx32", 3),
+            Field("InverseScale", "fx32", 3),
+            whenClear=FLAGS_SCALE_ONE),
+        selector="Flags",
+    )
+    
+    def __init__(self, data, offset):
+        self.Layout.ReadInto(self, data, offset)
     
     def GetTranslation(self, jntAnmResult):
         if (self.Flags & self.FLAGS_TRANSLATION_ZERO) != 0:
@@ -140,60 +254,44 @@ class G3dNodeData:
                 jntAnmResult.rot = rot
 
 class G3dMaterialSet:
-    def __init__(self, reader):
-        beginChunk = reader.tell()
-        
-        textureToMaterialListDictionaryOffset = unpack("<H", reader.read(2))[0]
-        paletteToMaterialListDictionaryOffset = unpack("<H", reader.read(2))[0]
-        self.MaterialDictionary = G3dDictionary(reader, OffsetDictionaryData)
-        reader.seek(textureToMaterialListDictionaryOffset + beginChunk)
-        self.TextureToMaterialListDictionary = G3dDictionary(reader, TextureToMaterialDictionaryData)
-        reader.seek(paletteToMaterialListDictionaryOffset + beginChunk)
-        self.PaletteToMaterialListDictionary = G3dDictionary(reader, PaletteToMaterialDictionaryData)
+    HeaderLayout = RecordLayout(
+        Field("TextureToMaterialListDictionaryOffset", "u16"),
+        Field("PaletteToMaterialListDictionaryOffset", "u16"),
+    )
+    
+    def __init__(self, data, offset):
+        self.MaterialDictionary, self.TextureToMaterialListDictionary, self.PaletteToMaterialListDictionary = \
+            self.ReadDictionaries(data, offset)
         self.Materials = []
         for i in range(len(self.MaterialDictionary)):
-            reader.seek(self.MaterialDictionary.Data[i].Data.Offset + beginChunk)
-            self.Materials.append(G3dMaterial(reader))
+            self.Materials.append(G3dMaterial(data, offset + self.MaterialDictionary.Data[i].Data.Offset))
         for item in self.TextureToMaterialListDictionary.Data:
-            reader.seek(item.Data.Offset + beginChunk)
-            item.Data.Materials.append(reader.read(item.Data.MaterialCount))
+            listOffset = offset + item.Data.Offset
+            item.Data.Materials.append(data[listOffset:listOffset + item.Data.MaterialCount])
         for item in self.PaletteToMaterialListDictionary.Data:
-            reader.seek(item.Data.Offset + beginChunk)
-            item.Data.Materials.append(reader.read(item.Data.MaterialCount))
-
-class G3dMaterial:
-    def __init__(self, reader):
-        beginChunk = reader.tell()
-        
-        self.ItemTag = unpack("<H", reader.read(2))[0]
-        Size = unpack("<H", reader.read(2))[0]
-        self.DiffuseAmbient = unpack("<I", reader.read(4))[0]
-        self.SpecularEmission = unpack("<I", reader.read(4))[0]
-        self.PolygonAttribute = GxPolygonAttr(unpack("<I", reader.read(4))[0])
-        self.PolygonAttributeMask = unpack("<I", reader.read(4))[0]
-        self.TexImageParam = GxTexImageParam(unpack("<I", reader.read(4))[0])
-        self.TexImageParamMask = unpack("<I", reader.read(4))[0]
-        self.TexPlttBase = unpack("<H", reader.read(2))[0]
-        self.Flags = unpack("<H", reader.read(2))[0]
-        self.OriginalWidth = unpack("<H", reader.read(2))[0]
-        self.OriginalHeight = unpack("<H", reader.read(2))[0]
-        self.MagW = ReadFx32(reader)
-        self.MagH = ReadFx32(reader)
-        if self.Flags & G3dMaterialFlags.TexMtxScaleOne.value == 0:
-            self.ScaleS = ReadFx32(reader)
-            self.ScaleT = ReadFx32(reader)
-        if self.Flags & G3dMaterialFlags.TexMtxRotZero.value == 0:
-            self.RotationSin = ReadFx16(reader)
-            self.RotationCos = ReadFx16(reader)
-        if self.Flags & G3dMaterialFlags.TexMtxTransZero.value == 0:
-            self.TranslationS = ReadFx32(reader)
-            self.TranslationT = ReadFx32(reader)
-        if self.Flags & G3dMaterialFlags.EffectMtx.value == G3dMaterialFlags.EffectMtx.value:
-            m = ReadFx32s(reader, 16)
-            self.EffectMtx = Matrix([[m[0],  m[1],  m[2],  m[3]],
-                                     [m[4],  m[5],  m[6],  m[7]],
-                                     [m[8],  m[9],  m[10], m[11]],
-                                     [m[12], m[13], m[14], m[15]]])
+            listOffset = offset + item.Data.Offset
+            item.Data.Materials.append(data[listOffset:listOffset + item.Data.MaterialCount])
+    
+    @staticmethod
+    def ReadDictionaries(data, offset):
+        textureToMaterialListDictionaryOffset, paletteToMaterialListDictionaryOffset = G3dMaterialSet.HeaderLayout.Read(data, offset)
+        return (G3dDictionary(data, offset + G3dMaterialSet.HeaderLayout.GetSize(), OffsetDictionaryData),
+                G3dDictionary(data, offset + textureToMaterialListDictionaryOffset, TextureToMaterialDictionaryData),
+                G3dDictionary(data, offset + paletteToMaterialListDictionaryOffset, PaletteToMaterialDictionaryData))
+    
+    def GetMaterial(self, name):
+        index = self.MaterialDictionary.IndexOf(name)
+        return self.Materials[index] if index >= 0 else None
+    
+    def GetTextureMaterialIds(self, textureName):
+        """Indices of the materials using the texture textureName."""
+        entry = self.TextureToMaterialListDictionary.Find(textureName)
+        return list(entry.Data.Materials[0]) if entry is not None else []
+    
+    def GetPaletteMaterialIds(self, paletteName):
+        """Indices of the materials using the palette paletteName."""
+        entry = self.PaletteToMaterialListDictionary.Find(paletteName)
+        return list(entry.Data.Materials[0]) if entry is not None else []
 
 class G3dMaterialFlags(Enum):
     TexMtxUse = 0x0001
@@ -211,43 +309,82 @@ class G3dMaterialFlags(Enum):
     TexPlttBase = 0x1000
     EffectMtx = 0x2000
 
+class G3dMaterial:
+    Layout = RecordLayout(
+        Field("ItemTag", "u16"),
+        Field(None, "u16"), #size
+        Field("DiffuseAmbient", "u32"),
+        Field("SpecularEmission", "u32"),
+        Field("PolygonAttribute", "u32", convert=GxPolygonAttr),
+        Field("PolygonAttributeMask", "u32"),
+        Field("TexImageParam", "u32", convert=GxTexImageParam),
+        Field("TexImageParamMask", "u32"),
+        Field("TexPlttBase", "u16"),
+        Field("Flags", "u16"),
+        Field("OriginalWidth", "u16"),
+        Field("OriginalHeight", "u16"),
+        Field("MagW", "fx32"),
+        Field("MagH", "fx32"),
+        OptionalFields(
+            Field("ScaleS", "fx32"),
+            Field("ScaleT", "fx32"),
+            whenClear=G3dMaterialFlags.TexMtxScaleOne.value),
+        OptionalFields(
+            Field("RotationSin", "fx16"),
+            Field("RotationCos", "fx16"),
+            whenClear=G3dMaterialFlags.TexMtxRotZero.value),
+        OptionalFields(
+            Field("TranslationS", "fx32"),
+            Field("TranslationT", "fx32"),
+            whenClear=G3dMaterialFlags.TexMtxTransZero.value),
+        OptionalFields(
+            Field("EffectMtx", "fx32", 16, lambda m: np.array(m).reshape(4, 4)),
+            whenSet=G3dMaterialFlags.EffectMtx.value),
+        selector="Flags",
+    )
+    
+    def __init__(self, data, offset):
+        self.Layout.ReadInto(self, data, offset)
+
 class G3dShapeSet:
-    def __init__(self, reader):
-        BeginChunk = reader.tell()
-        
-        self.ShapeDictionary = G3dDictionary(reader, OffsetDictionaryData)
+    def __init__(self, data, offset):
+        self.ShapeDictionary = G3dDictionary(data, offset, OffsetDictionaryData)
         self.Shapes = []
         for i in range(len(self.ShapeDictionary)):
-            reader.seek(BeginChunk + self.ShapeDictionary.Data[i].Data.Offset)
-            self.Shapes.append(G3dShape(reader))
+            self.Shapes.append(G3dShape(data, offset + self.ShapeDictionary.Data[i].Data.Offset))
 
-class G3dShape:
-    def __init__(self, reader):
-        BeginChunk = reader.tell()
-        
-        self.ItemTag = unpack("<H", reader.read(2))[0]
-        Size = unpack("<H", reader.read(2))[0]
-        self.Flags = unpack("<I", reader.read(4))[0]
-        DisplaylistOffset = unpack("<I", reader.read(4))[0]
-        DisplaylistSize = unpack("<I", reader.read(4))[0]
-        reader.seek(BeginChunk + DisplaylistOffset)
-        self.DisplayList = reader.read(DisplaylistSize)
+class G3dShape(ViewPickling):
+    Layout = RecordLayout(
+        Field("ItemTag", "u16"),
+        Field("Size", "u16"),
+        Field("Flags", "u32"),
+        Field("DisplaylistOffset", "u32"),
+        Field("DisplaylistSize", "u32"),
+    )
+    
+    def __init__(self, data, offset):
+        self.ItemTag, Size, self.Flags, DisplaylistOffset, DisplaylistSize = self.Layout.Read(data, offset)
+        self.DisplayList = data[offset + DisplaylistOffset:offset + DisplaylistOffset + DisplaylistSize]
 
 class G3dEnvelopeMatrices:
-    def __init__(self, reader, nodeCount):
+    def __init__(self, data, offset, nodeCount):
         self.Envelopes = []
         for i in range(nodeCount):
-            self.Envelopes.append(G3dEnvelope(reader))
+            self.Envelopes.append(G3dEnvelope(data, offset + i * G3dEnvelope.Layout.GetSize()))
 
 class G3dEnvelope:
-    def __init__(self, reader):
-        m = ReadFx32s(reader, 16)
-        self.InversePositionMatrix = Matrix([[m[0], m[1],  m[2],  0.0],
-                                             [m[3], m[4],  m[5],  0.0],
-                                             [m[6], m[7],  m[8],  0.0],
-                                             [m[9], m[10], m[11], 1.0]])
-        m = ReadFx32s(reader, 9)
-        self.InverseDirectionMatrix = Matrix([[m[0], m[1], m[2], 0.0],
-                                              [m[3], m[4], m[5], 0.0],
-                                              [m[6], m[7], m[8], 0.0],
-                                              [0.0,  0.0,  0.0,  1.0]])
\ No newline at end of file
+    Layout = RecordLayout(
+        Field("InversePositionMatrix", "fx32", 16),
+        Field("InverseDirectionMatrix", "fx32", 9),
+    )
+    
+    def __init__(self, data, offset):
+        m, n = self.Layout.Read(data, offset)
+        self.InversePositionMatrix = np.array([[m[0], m[1],  m[2],  0.0],
+                                               [m[3], m[4],  m[5],  0.0],
+                                               [m[6], m[7],  m[8],  0.0],
+                                               [m[9], m[10], m[11], 1.0]])
+        self.InverseDirectionMatrix = np.array([[n[0], n[1], n[2], 0.0],
+                                                [n[3], n[4], n[5], 0.0],
+                                                [n[6], n[7], n[8], 0.0],
+                                                [0.0,  0.0,  0.0,  1.0]])
\ No newline at end of file
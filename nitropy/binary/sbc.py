@@ -2,7 +2,25 @@ from .nitro import *
 from struct import unpack, unpack_from
 from io import BytesIO
 from enum import Enum
-from mathutils import Matrix, Vector
+import numpy as np
+
+# the flag enums as plain ints, resolving .value on every command is a large part of a draw
+RsNodeVisible = G3dRenderStateFlag.NodeVisible.value
+RsMaterialTransparent = G3dRenderStateFlag.MaterialTransparent.value
+RsCurrentNodeValid = G3dRenderStateFlag.CurrentNodeValid.value
+RsCurrentMaterialValid = G3dRenderStateFlag.CurrentMaterialValid.value
+RsCurrentNodeDescriptionValid = G3dRenderStateFlag.CurrentNodeDescriptionValid.value
+RsReturn = G3dRenderStateFlag.Return.value
+RsSkip = G3dRenderStateFlag.Skip.value
+RsOptRecord = G3dRenderStateFlag.OptRecord.value
+RsOptNoGeCmd = G3dRenderStateFlag.OptNoGeCmd.value
+RsOptSkipSbcDraw = G3dRenderStateFlag.OptSkipSbcDraw.value
+RsOptSkipSbcMtxCalc = G3dRenderStateFlag.OptSkipSbcMtxCalc.value
+
+RoRecord = G3dRenderObjectFlag.Record.value
+RoNoGeCmd = G3dRenderObjectFlag.NoGeCmd.value
+RoSkipSbcDraw = G3dRenderObjectFlag.SkipSbcDraw.value
+RoSkipSbcMtxCalc = G3dRenderObjectFlag.SkipSbcMtxCalc.value
 
 class G3dRenderState:
     def __init__(self):
@@ -12,6 +30,7 @@ class G3dRenderState:
         self.Flag = 0
         self._callbackFunctions = [object] * Sbc.CommandNum
         self._callbackTimings = [object] * Sbc.CommandNum
+        self.HasCallback = False
         self.CurrentNode = 0
         self.CurrentMaterial = 0
         self.CurrentNodeDescription = 0
@@ -40,6 +59,7 @@ class G3dRenderState:
         self.Flag = 0
         self._callbackFunctions = [None] * Sbc.CommandNum
         self._callbackTimings = [None] * Sbc.CommandNum
+        self.HasCallback = False
         self.CurrentNode = 0
         self.CurrentMaterial = 0
         self.CurrentNodeDescription = 0
@@ -65,27 +85,28 @@ class G3dRenderState:
     def SetCallback(self, function, command, timing):
         self._callbackFunctions[command] = function
         self._callbackTimings[command] = timing
+        self.HasCallback = True
     
     def GetCallbackTiming(self, cmd):
         return self._callbackTimings[cmd] if self._callbackFunctions[cmd] is not None else SbcCallbackTiming.Null
     
     def PerformCallbackA(self, context, cmd) -> bool:
         if self.GetCallbackTiming(cmd) == SbcCallbackTiming.TimingA:
-            self.Flag &= ~G3dRenderStateFlag.Skip.value
+            self.Flag &= ~RsSkip
             self._callbackFunctions[cmd](context)
-            return self.Flag & G3dRenderStateFlag.Skip.value != 0
+            return self.Flag & RsSkip != 0
         return False
     def PerformCallbackB(self, context, cmd) -> bool:
         if self.GetCallbackTiming(cmd) == SbcCallbackTiming.TimingB:
-            self.Flag &= ~G3dRenderStateFlag.Skip.value
+            self.Flag &= ~RsSkip
             self._callbackFunctions[cmd](context)
-            return self.Flag & G3dRenderStateFlag.Skip.value != 0
+            return self.Flag & RsSkip != 0
         return False
     def PerformCallbackC(self, context, cmd) -> bool:
         if self.GetCallbackTiming(cmd) == SbcCallbackTiming.TimingC:
-            self.Flag &= ~G3dRenderStateFlag.Skip.value
+            self.Flag &= ~RsSkip
             self._callbackFunctions[cmd](context)
-            return self.Flag & G3dRenderStateFlag.Skip.value != 0
+            return self.Flag & RsSkip != 0
         return False
 
 class SbcCallbackTiming(Enum):
@@ -110,10 +131,53 @@ class SbcCommand(Enum):
     EnvironmentMap = 0x0C
     ProjectionMap = 0x0D
 
+SbcCmdNode = SbcCommand.Node.value
+SbcCmdMatrix = SbcCommand.Matrix.value
+SbcCmdShape = SbcCommand.Shape.value
+SbcCmdNodeDescription = SbcCommand.NodeDescription.value
+
 class SbcNodeDescFlag:
     MayaSscApply  = 0x01
     MayaSscParent = 0x02
 
+class SbcProgram(ViewPickling):
+    """A SBC compiled once into a list of (cmd, opt, position, operands) instructions,
+    operands being the bytes following the opcode. The last instruction is the Return."""
+    # length of the commands without their optional operands
+    CommandLengths = [1, 1, 3, 2, 2, 2, 4, 2, 2, 3, 9, 1, 3, 3]
+    
+    def __init__(self, data):
+        self.Data = data
+        self.Instructions = []
+        pos = 0
+        while True:
+            if pos >= len(data):
+                raise Exception("SBC without Return command.")
+            cmd = data[pos] & Sbc.SbcCmdMask
+            opt = data[pos] & Sbc.SbcFlgMask
+            if cmd >= len(self.CommandLengths):
+                raise Exception(f"Unknown SBC command {cmd:#x} at {pos:#x}")
+            length = self.GetCommandLength(data, pos, cmd, opt)
+            if pos + length > len(data):
+                raise Exception(f"Truncated SBC command {cmd:#x} at {pos:#x}")
+            self.Instructions.append((cmd, opt, pos, bytes(data[pos + 1:pos + length])))
+            if cmd == SbcCommand.Return.value:
+                break
+            pos += length
+    
+    @staticmethod
+    def GetCommandLength(data, pos, cmd, opt):
+        length = SbcProgram.CommandLengths[cmd]
+        if cmd in (SbcCommand.NodeDescription.value, SbcCommand.Billboard.value, SbcCommand.BillboardY.value):
+            # matrix store and restore indices
+            if opt == Sbc.SbcFlg001 or opt == Sbc.SbcFlg011:
+                length += 1
+            if opt == Sbc.SbcFlg010 or opt == Sbc.SbcFlg011:
+                length += 1
+        elif cmd == SbcCommand.NodeMix.value and pos + 2 < len(data):
+            length += data[pos + 2] * 3
+        return length
+
 class Sbc:
     NoCmd = 0x1f
     CommandNum = 0x20
@@ -166,13 +230,22 @@ class Sbc:
             0x7fffffff
         ]
     
+    @staticmethod
+    def GetProgram(renderObj):
+        if not renderObj.UserSbc:
+            return renderObj.ModelResource.SbcProgram
+        if renderObj.UserSbcProgram is None or renderObj.UserSbcProgram.Data is not renderObj.UserSbc:
+            renderObj.UserSbcProgram = SbcProgram(renderObj.UserSbc)
+        return renderObj.UserSbcProgram
+    
     def DrawInternal(self, renderState, renderObj):
         renderState.Clear()
         renderState.IsScaleCacheOne[0] = True
         
-        renderState.Flag = G3dRenderStateFlag.NodeVisible.value
+        renderState.Flag = RsNodeVisible
         
-        renderState.SbcData = renderObj.UserSbc or renderObj.ModelResource.Sbc
+        program = self.GetProgram(renderObj)
+        renderState.SbcData = program.Data
         
         renderState.RenderObject = renderObj
         
@@ -188,33 +261,39 @@ class Sbc:
         if renderObj.CallbackFunction is not None and renderObj.CallbackCmd < Sbc.CommandNum:
             renderState.SetCallback(renderObj.CallbackFunction, renderObj.CallbackCmd, renderObj.CallbackTiming)
         
-        if renderObj.Flag & G3dRenderObjectFlag.Record.value != 0:
-            renderState.Flag |= G3dRenderStateFlag.OptRecord.value
-
-        if renderObj.Flag & G3dRenderObjectFlag.NoGeCmd.value != 0:
-            renderState.Flag |= G3dRenderStateFlag.OptNoGeCmd.value
-
-        if renderObj.Flag & G3dRenderObjectFlag.SkipSbcDraw.value != 0:
-            renderState.Flag |= G3dRenderStateFlag.OptSkipSbcDraw.value
-
-        if renderObj.Flag & G3dRenderObjectFlag.SkipSbcMtxCalc.value != 0:
-            renderState.Flag |= G3dRenderStateFlag.OptSkipSbcMtxCalc.value
+        if renderObj.Flag & RoRecord != 0:
+            renderState.Flag |= RsOptRecord
+        
+        if renderObj.Flag & RoNoGeCmd != 0:
+            renderState.Flag |= RsOptNoGeCmd
+        
+        if renderObj.Flag & RoSkipSbcDraw != 0:
+            renderState.Flag |= RsOptSkipSbcDraw
+        
+        if renderObj.Flag & RoSkipSbcMtxCalc != 0:
+            renderState.Flag |= RsOptSkipSbcMtxCalc
         
         if renderObj.CallbackInitFunction:
             renderObj.CallbackInitFunction(self._context)
         
-        while True:
-            renderState.Flag &= ~G3dRenderStateFlag.Skip.value
-            cmd = self.GetSbc(renderState.SbcData, renderState.c) & Sbc.SbcCmdMask
-            opt = self.GetSbc(renderState.SbcData, renderState.c) & Sbc.SbcFlgMask
-            self.SbcFunctionTable[cmd](renderState, opt)
-            if renderState.Flag & G3dRenderStateFlag.Return.value != 0:
-                break
+        functionTable = self.SbcFunctionTable
+        if not renderState.HasCallback:
+            # only a callback can set Skip or return early, the program ends on its Return
+            for cmd, opt, pos, args in program.Instructions:
+                renderState.c = pos
+                functionTable[cmd](renderState, opt, args)
+        else:
+            for cmd, opt, pos, args in program.Instructions:
+                renderState.Flag &= ~RsSkip
+                renderState.c = pos
+                functionTable[cmd](renderState, opt, args)
+                if renderState.Flag & RsReturn != 0:
+                    break
         
-        renderObj.Flag &= ~G3dRenderObjectFlag.Record.value
+        renderObj.Flag &= ~RoRecord
     
     def GetSbc(self, data, ptr):
-        return unpack("<B", data[ptr:ptr+1])[0]
+        return data[ptr]
     
     def Draw(self, renderObj):
         if renderObj.TestFlag(G3dRenderObjectFlag.HintObsolete.value):
@@ -228,119 +307,111 @@ class Sbc:
             self.DrawInternal(self._context.RenderState, renderObj)
             self._context.RenderState = None
     
-    def SbcNop(self, renderState, opt):
-        renderState.c += 1
+    def SbcNop(self, renderState, opt, args):
+        pass
     
-    def SbcRet(self, renderState, opt):
-        renderState.Flag |= G3dRenderStateFlag.Return.value
+    def SbcRet(self, renderState, opt, args):
+        renderState.Flag |= RsReturn
     
-    def SbcNode(self, renderState, opt):
-        if renderState.Flag & G3dRenderStateFlag.OptSkipSbcDraw.value == 0:
-            renderState.CurrentNode = self.GetSbc(renderState.SbcData, renderState.c + 1)
+    def SbcNode(self, renderState, opt, args):
+        if renderState.Flag & RsOptSkipSbcDraw == 0:
+            renderState.CurrentNode = args[0]
             curNode = renderState.CurrentNode
-            renderState.Flag |= G3dRenderStateFlag.CurrentNodeValid.value
+            renderState.Flag |= RsCurrentNodeValid
             renderState.VisibilityAnimation = renderState.TmpVisAnmResult
-
-            if not renderState.PerformCallbackA(self._context, SbcCommand.Node.value):
+            hasCallback = renderState.HasCallback
+            
+            if not (hasCallback and renderState.PerformCallbackA(self._context, SbcCmdNode)):
                 #incomplete
                 if renderState.RenderObject.VisibilityAnimations is None or \
                     not renderState.RenderObject.VisibilityAnimationMayExist[curNode]:
-                        renderState.VisibilityAnimation.IsVisible = self.GetSbc(renderState.SbcData, renderState.c + 2) & 1 == 1
-
-            if not renderState.PerformCallbackB(self._context, SbcCommand.Node.value):
+                        renderState.VisibilityAnimation.IsVisible = args[1] & 1 == 1
+            
+            if not (hasCallback and renderState.PerformCallbackB(self._context, SbcCmdNode)):
                 if renderState.VisibilityAnimation.IsVisible:
-                    renderState.Flag |= G3dRenderStateFlag.NodeVisible.value
+                    renderState.Flag |= RsNodeVisible
                 else:
-                    renderState.Flag &= ~G3dRenderStateFlag.NodeVisible.value
+                    renderState.Flag &= ~RsNodeVisible
             
-            renderState.PerformCallbackC(self._context, SbcCommand.Node.value)
-        
-        renderState.c += 3
+            if hasCallback:
+                renderState.PerformCallbackC(self._context, SbcCmdNode)
     
-    def SbcMtx(self, renderState, opt):
-        if renderState.Flag & G3dRenderStateFlag.OptSkipSbcDraw.value == 0 and \
-            renderState.Flag & G3dRenderStateFlag.NodeVisible.value != 0:
-                if not renderState.PerformCallbackA(self._context, SbcCommand.Matrix.value):
-                    if renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0:
-                        self._context.GeState.RestoreMatrix(self.GetSbc(renderState.SbcData, renderState.c + 1))
-            
-                renderState.PerformCallbackC(self._context, SbcCommand.Matrix.value)
-        
-        renderState.c += 2
+    def SbcMtx(self, renderState, opt, args):
+        if renderState.Flag & RsOptSkipSbcDraw == 0 and \
+            renderState.Flag & RsNodeVisible != 0:
+                hasCallback = renderState.HasCallback
+                if not (hasCallback and renderState.PerformCallbackA(self._context, SbcCmdMatrix)):
+                    if renderState.Flag & RsOptNoGeCmd == 0:
+                        self._context.GeState.RestoreMatrix(args[0])
+                
+                if hasCallback:
+                    renderState.PerformCallbackC(self._context, SbcCmdMatrix)
     
     def SbcMatDefault(self, renderState, opt, mat, idxMat):
         #i have not enough patience to do this sorry
-        pass
+        renderState.CurrentMaterial = idxMat
+        renderState.Flag |= RsCurrentMaterialValid
     
-    def SbcMat(self, renderState, opt):
-        if renderState.Flag & G3dRenderStateFlag.OptSkipSbcDraw.value == 0:
-            idxMat = self.GetSbc(renderState.SbcData, renderState.c + 1)
-            if renderState.Flag & G3dRenderStateFlag.NodeVisible.value != 0 or \
-                not renderState.Flag & G3dRenderStateFlag.CurrentMaterialValid.value != 0 and \
+    def SbcMat(self, renderState, opt, args):
+        if renderState.Flag & RsOptSkipSbcDraw == 0:
+            idxMat = args[0]
+            if renderState.Flag & RsNodeVisible != 0 or \
+                not renderState.Flag & RsCurrentMaterialValid != 0 and \
                 idxMat == renderState.CurrentMaterial:
                     mat = renderState.MaterialResource.Materials[idxMat]
                     self.FuncSbcMatTable[mat.ItemTag](renderState, opt, mat, idxMat)
-        
-        renderState.c += 2
     
     def SbcShpDefault(self, renderState, opt, shp, shpIdx):
-        if not renderState.PerformCallbackA(self._context, SbcCommand.Shape.value) and \
-            renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0:
-                self._context.RenderShp(shp, renderState.RenderObject.ShapeProxies[shpIdx])
+        hasCallback = renderState.HasCallback
+        if not (hasCallback and renderState.PerformCallbackA(self._context, SbcCmdShape)) and \
+            renderState.Flag & RsOptNoGeCmd == 0:
+                idxMat = renderState.CurrentMaterial if renderState.Flag & RsCurrentMaterialValid != 0 else -1
+                self._context.RenderShp(shpIdx, shp, renderState.RenderObject.ShapeProxies[shpIdx], idxMat)
         
-        renderState.PerformCallbackB(self._context, SbcCommand.Shape.value)
-        renderState.PerformCallbackC(self._context, SbcCommand.Shape.value)
+        if hasCallback:
+            renderState.PerformCallbackB(self._context, SbcCmdShape)
+            renderState.PerformCallbackC(self._context, SbcCmdShape)
     
-    def SbcShp(self, renderState, opt):
-        if renderState.Flag & G3dRenderStateFlag.OptSkipSbcDraw.value == 0 and \
-            renderState.Flag & G3dRenderStateFlag.MaterialTransparent.value == 0 and \
-            renderState.Flag & G3dRenderStateFlag.NodeVisible.value != 0:
-                idxShp = self.GetSbc(renderState.SbcData, renderState.c + 1)
+    def SbcShp(self, renderState, opt, args):
+        if renderState.Flag & RsOptSkipSbcDraw == 0 and \
+            renderState.Flag & RsMaterialTransparent == 0 and \
+            renderState.Flag & RsNodeVisible != 0:
+                idxShp = args[0]
                 shp    = renderState.ShapeResource.Shapes[idxShp]
                 self.FuncSbcShpTable[shp.ItemTag](renderState, opt, shp, idxShp)
-        
-        renderState.c += 2
     
-    def SbcNodeDesc(self, renderState, opt):
-        cmdLen = 4
-        
-        idxNode = self.GetSbc(renderState.SbcData, renderState.c + 1)
+    def SbcNodeDesc(self, renderState, opt, args):
+        idxNode = args[0]
         renderState.CurrentNodeDesc = idxNode
-        renderState.Flag |= G3dRenderStateFlag.CurrentNodeDescriptionValid.value
+        renderState.Flag |= RsCurrentNodeDescriptionValid
         
-        if renderState.Flag & G3dRenderStateFlag.OptSkipSbcMtxCalc.value != 0:
-            if opt == Sbc.SbcFlg010 or opt == Sbc.SbcFlg011:
-                cmdLen += 1
-            
+        if renderState.Flag & RsOptSkipSbcMtxCalc != 0:
             if opt == Sbc.SbcFlg001 or opt == Sbc.SbcFlg011:
-                cmdLen += 1
-                if renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0:
-                    self._context.GeState.RestoreMatrix(self.GetSbc(renderState.SbcData, renderState.c + 4))
-            
-            renderState.c += cmdLen
+                if renderState.Flag & RsOptNoGeCmd == 0:
+                    self._context.GeState.RestoreMatrix(args[3])
             return
         
         if opt == Sbc.SbcFlg010 or opt == Sbc.SbcFlg011:
-            cmdLen += 1
-            if renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0:
-                self._context.GeState.RestoreMatrix(self.GetSbc(renderState.SbcData, renderState.c + (4 if opt == Sbc.SbcFlg010 else 5)))
+            if renderState.Flag & RsOptNoGeCmd == 0:
+                self._context.GeState.RestoreMatrix(args[3 if opt == Sbc.SbcFlg010 else 4])
         
         renderState.JointAnimation = renderState.TmpJntAnmResult
+        hasCallback = renderState.HasCallback
         
-        if not renderState.PerformCallbackA(self._context, SbcCommand.NodeDescription.value):
+        if not (hasCallback and renderState.PerformCallbackA(self._context, SbcCmdNodeDescription)):
             anmResult = 0
             isUseRecordData = False
             
             if renderState.RenderObject.RecordedJointAnimations is not None:
                 anmResult       = renderState.RenderObject.RecordedJointAnimations[idxNode]
-                isUseRecordData = (renderState.Flag & G3dRenderStateFlag.OptRecord) == 0
+                isUseRecordData = (renderState.Flag & RsOptRecord) == 0
             else:
                 isUseRecordData = False
                 anmResult       = renderState.TmpJntAnmResult
             
             if not isUseRecordData:
                 anmResult.Flag = 0
-
+                
                 if renderState.RenderObject.JointAnimations is None:
                     nodeData = renderState.NodeResource.Data[idxNode]
                     nodeData.GetTranslation(anmResult)
@@ -350,99 +421,70 @@ class Sbc:
             
             renderState.JointAnimation = anmResult
         
-        if not renderState.PerformCallbackB(self._context, SbcCommand.NodeDescription.value) \
-                    and renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0:
+        if not (hasCallback and renderState.PerformCallbackB(self._context, SbcCmdNodeDescription)) \
+                    and renderState.Flag & RsOptNoGeCmd == 0:
             #incomplete
             renderState.SendJointSrt(renderState.JointAnimation, self._context)
         
         renderState.JointAnimation = None
         
-        callbackFlag = renderState.PerformCallbackC(self._context, SbcCommand.NodeDescription.value)
+        callbackFlag = hasCallback and renderState.PerformCallbackC(self._context, SbcCmdNodeDescription)
         if opt == Sbc.SbcFlg001 or opt == Sbc.SbcFlg011:
-            cmdLen += 1
-            
-            if not callbackFlag and renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0:
-                self._context.GeState.StoreMatrix(self.GetSbc(renderState.SbcData, renderState.c + 4))
-        
-        renderState.c += cmdLen
+            if not callbackFlag and renderState.Flag & RsOptNoGeCmd == 0:
+                self._context.GeState.StoreMatrix(args[3])
     
-    def SbcBB(self, renderState, opt):
-        print("sbcbb")
+    def SbcBB(self, renderState, opt, args):
+        #incomplete
         pass
-    def SbcBBY(self, renderState, opt):
-        print("sbcbby")
+    def SbcBBY(self, renderState, opt, args):
+        #incomplete
         pass
-    def SbcNodeMix(self, renderState, opt):
-        w = 0
+    def SbcNodeMix(self, renderState, opt, args):
+        geState = self._context.GeState
         evpMtx = renderState.RenderObject.ModelResource.EnvelopeMatrices
-        numMtx = self.GetSbc(renderState.SbcData, renderState.c + 2)
-        p = 3
-        y = None
+        envelopeCache = self._context.GlobalRenderState.EnvelopeCache
         
-        sumM = Matrix.Identity(4)
-        sumN = Matrix.Identity(4)
+        sumM = np.zeros((4, 4))
+        sumN = np.zeros((4, 4))
         
-        for i in range(numMtx):
-            idxJnt = self.GetSbc(renderState.SbcData, renderState.c + p + 1)
-            evpCached = renderState.IsEnvelopeCached[idxJnt]
-            
-            x = self._context.GlobalRenderState.EnvelopeCache[idxJnt]
-            if not evpCached:
+        # (matrix stack index, joint, weight) triplets
+        for p in range(2, 2 + args[1] * 3, 3):
+            idxJnt = args[p + 1]
+            x = envelopeCache[idxJnt]
+            if not renderState.IsEnvelopeCached[idxJnt]:
                 renderState.IsEnvelopeCached[idxJnt] = True
-                self._context.GeState.RestoreMatrix(self.GetSbc(renderState.SbcData, renderState.c + p))
-                self._context.GeState.MatrixMode = GxMtxMode.Position
-                self._context.GeState.MultMatrix(evpMtx.Envelopes[idxJnt].InversePositionMatrix)
-            
-            if i != 0:
-                sumN[0] = y.DirectionMtx[0]
-                sumN[1] = y.DirectionMtx[1]
-                sumN[2] = y.DirectionMtx[2]
-            
-            if not evpCached:
-                x.PositionMtx = self._context.GeState.PositionMatrix
-                self._context.GeState.MatrixMode = GxMtxMode.PositionVector
-                self._context.GeState.MultMatrix(evpMtx.Envelopes[idxJnt].InverseDirectionMatrix)
-            
-            w = self.GetSbc(renderState.SbcData, renderState.c + p + 1) / 256.0
+                geState.RestoreMatrix(args[p])
+                geState.MatrixMode = GxMtxMode.Position
+                geState.MultMatrix(evpMtx.Envelopes[idxJnt].InversePositionMatrix)
+                x.PositionMtx[...] = geState.PositionMatrix
+                geState.MatrixMode = GxMtxMode.PositionVector
+                geState.MultMatrix(evpMtx.Envelopes[idxJnt].InverseDirectionMatrix)
+                x.DirectionMtx[...] = geState.DirectionMatrix
             
-            sumM[0] += w * x.PositionMtx[0]
-            sumM[1] += w * x.PositionMtx[1]
-            sumM[2] += w * x.PositionMtx[2]
-            sumM[3] += w * x.PositionMtx[3]
-            
-            p += 3
-            y = self._context.GlobalRenderState.EnvelopeCache[idxJnt]
-            
-            if not evpCached:
-                y.DirectionMtx = self._context.GeState.DirectionMatrix
+            w = args[p + 2] / 256.0
+            sumM += w * x.PositionMtx
+            sumN += w * x.DirectionMtx
         
-        sumN[0] += w * y.DirectionMtx[0]
-        sumN[1] += w * y.DirectionMtx[1]
-        sumN[2] += w * y.DirectionMtx[2]
+        geState.LoadMatrix(sumN)
+        geState.MatrixMode = GxMtxMode.Position
+        geState.LoadMatrix(sumM)
+        geState.MatrixMode = GxMtxMode.PositionVector
         
-        self._context.GeState.LoadMatrix(sumN)
-        self._context.GeState.MatrixMode = GxMtxMode.Position
-        self._context.GeState.LoadMatrix(sumM)
-        self._context.GeState.MatrixMode = GxMtxMode.PositionVector
-
-        self._context.GeState.StoreMatrix(self.GetSbc(renderState.SbcData, renderState.c + 1))
-        renderState.c += 3 + self.GetSbc(renderState.SbcData, renderState.c + 2) * 3
+        geState.StoreMatrix(args[0])
     
-    def SbcCallDl(self, renderState, opt):
-        print("sbccalldl")
+    def SbcCallDl(self, renderState, opt, args):
+        #incomplete
         pass
     
-    def SbcPosScale(self, renderState, opt):
-        if renderState.Flag & G3dRenderStateFlag.OptNoGeCmd.value == 0 and \
-            renderState.Flag & G3dRenderStateFlag.OptSkipSbcDraw.value == 0:
+    def SbcPosScale(self, renderState, opt, args):
+        if renderState.Flag & RsOptNoGeCmd == 0 and \
+            renderState.Flag & RsOptSkipSbcDraw == 0:
                 s = renderState.PosScale if opt == Sbc.SbcFlg000 else renderState.InversePosScale
-                self._context.GeState.Scale(Vector([s, s, s]))
-        
-        renderState.c += 1
+                self._context.GeState.Scale((s, s, s))
     
-    def SbcEnvMap(self, renderState, opt):
-        print("sbcenvmap")
+    def SbcEnvMap(self, renderState, opt, args):
+        #incomplete
+        pass
+    def SbcPrjMap(self, renderState, opt, args):
+        #incomplete
         pass
-    def SbcPrjMap(self, renderState, opt):
-        print("sbcprjmap")
-        pass
\ No newline at end of file
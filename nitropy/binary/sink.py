@@ -0,0 +1,75 @@
+import numpy as np
+
+def PackRegister(value):
+    """The raw value of a material register (an int or a Gx* register object), -1 for None."""
+    return -1 if value is None else int(value)
+
+class ShapeMaterial:
+    """The material state a shape is drawn with."""
+    def __init__(self, index, color0, color1, polygonAttr, texImageParam):
+        # -1 when no material command ran before the shape
+        self.Index = index
+        self.MaterialColor0 = color0
+        self.MaterialColor1 = color1
+        self.PolygonAttr = polygonAttr
+        self.TexImageParam = texImageParam
+
+class ShapeSink:
+    """Receives the shapes drawn by a G3dModelRenderer. The matrices given to DrawShape are
+    the live geometry engine ones, a sink keeping them has to copy them."""
+    def BeginModel(self, model):
+        pass
+
+    def DrawShape(self, index, shape, buffer, positionMatrix, directionMatrix, material):
+        raise NotImplementedError
+
+    def EndModel(self):
+        pass
+
+class NullSink(ShapeSink):
+    """Drops every shape, to time the parsing, the SBC and the display list decoding alone."""
+    def DrawShape(self, index, shape, buffer, positionMatrix, directionMatrix, material):
+        pass
+
+class DrawnShape:
+    def __init__(self, index, shape, buffer, positionMatrix, directionMatrix, material):
+        self.Index = index
+        self.Shape = shape
+        self.Buffer = buffer
+        self.PositionMatrix = positionMatrix
+        self.DirectionMatrix = directionMatrix
+        self.Material = material
+
+class CollectorSink(ShapeSink):
+    """Keeps every drawn shape in memory, passing them on to next when given."""
+    def __init__(self, next=None):
+        self.Next = next
+        self.Draws = []
+
+    def BeginModel(self, model):
+        if self.Next is not None:
+            self.Next.BeginModel(model)
+
+    def DrawShape(self, index, shape, buffer, positionMatrix, directionMatrix, material):
+        self.Draws.append(DrawnShape(index, shape, buffer, positionMatrix.copy(), directionMatrix.copy(), material))
+        if self.Next is not None:
+            self.Next.DrawShape(index, shape, buffer, positionMatrix, directionMatrix, material)
+
+    def EndModel(self):
+        if self.Next is not None:
+            self.Next.EndModel()
+
+    def GetArrays(self):
+        """The shape and material indices, the matrices and the material state of the draws,
+        in draw order."""
+        return {
+            "ShapeIndices": np.array([draw.Index for draw in self.Draws], dtype=np.int32),
+            "MaterialIndices": np.array([draw.Material.Index for draw in self.Draws], dtype=np.int32),
+            "PositionMatrices": np.array([draw.PositionMatrix for draw in self.Draws], dtype=np.float64).reshape(-1, 4, 4),
+            "DirectionMatrices": np.array([draw.DirectionMatrix for draw in self.Draws], dtype=np.float64).reshape(-1, 4, 4),
+            # the geometry engine material registers of the draws, see PackRegister
+            "MaterialColors0": np.array([PackRegister(draw.Material.MaterialColor0) for draw in self.Draws], dtype=np.int64),
+            "MaterialColors1": np.array([PackRegister(draw.Material.MaterialColor1) for draw in self.Draws], dtype=np.int64),
+            "PolygonAttrs": np.array([PackRegister(draw.Material.PolygonAttr) for draw in self.Draws], dtype=np.int64),
+            "TexImageParams": np.array([PackRegister(draw.Material.TexImageParam) for draw in self.Draws], dtype=np.int64),
+        }
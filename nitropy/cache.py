@@ -0,0 +1,176 @@
+import os
+import time
+import shutil
+import hashlib
+import zipfile
+import numpy as np
+
+from .binary import displaylist
+
+# bumped when the layout of the entries changes
+CacheFormat = 7
+DefaultBudget = 1 << 30
+# a process walks the cache directory again every Budget // WalkFraction bytes it stores, to
+# count what the other processes stored meanwhile
+WalkFraction = 8
+# temporary files older than this many seconds were left by a process killed while storing
+StaleTmpAge = 600
+
+# [bytes of the entries of every cache directory, bytes stored since the last walk], as of the
+# last walk of this process plus what it stored since
+_usage = {}
+
+def DefaultCacheDirectory():
+    root = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "nitropy", "geometry")
+
+DrawArrayNames = ("ShapeIndices", "MaterialIndices", "PositionMatrices", "DirectionMatrices",
+                  "MaterialColors0", "MaterialColors1", "PolygonAttrs", "TexImageParams")
+
+class CachedModel:
+    def __init__(self, shapeProxies, draws):
+        self.ShapeProxies = shapeProxies
+        # CollectorSink.GetArrays of the shapes drawn by the SBC
+        self.Draws = draws
+
+class GeometryCache:
+    """Decoded shape buffers and evaluated draw matrices of models, stored as one .npz file per
+    model, every array kind of the shapes concatenated with a table of per shape offsets.
+    Entries are keyed by a hash of the file content and the NitroPy version, the least
+    recently used ones are removed past budget bytes."""
+    def __init__(self, directory=None, budget=DefaultBudget):
+        self.Directory = directory or DefaultCacheDirectory()
+        self.Budget = budget
+        # (data, options, key) of the last GetFileKey
+        self._lastKey = None
+        os.makedirs(self.Directory, exist_ok=True)
+
+    @staticmethod
+    def GetKey(data, options=()):
+        """options are the decode options that change the cached buffers."""
+        from . import bl_info
+        hash = hashlib.blake2b(digest_size=16)
+        hash.update(f"{bl_info['version']}/{CacheFormat}/{'/'.join(options)}/".encode())
+        hash.update(data)
+        return hash.hexdigest()
+
+    def GetFileKey(self, data, options=()):
+        """GetKey, hashing data once for all the models of a file looked up one after the other."""
+        options = tuple(options)
+        if self._lastKey is None or self._lastKey[0] is not data or self._lastKey[1] != options:
+            self._lastKey = (data, options, self.GetKey(data, options))
+        return self._lastKey[2]
+
+    def _EntryPath(self, key, modelIndex):
+        return os.path.join(self.Directory, f"{key}-{modelIndex}.npz")
+
+    def Load(self, key, modelIndex):
+        path = self._EntryPath(key, modelIndex)
+        try:
+            with np.load(path) as entry:
+                offsets = entry["offsets"]
+                flags = entry["flags"]
+                welded = entry["welded"]
+                arrays = {name: entry[f"shapes.{name}"] for name in displaylist.DisplayListBuffer.ArrayNames}
+                draws = {name: entry[f"draws.{name}"] for name in DrawArrayNames}
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        shapeProxies = []
+        for i in range(len(flags)):
+            shapeArrays = {name: array[offsets[i, j]:offsets[i + 1, j]] for j, (name, array) in enumerate(arrays.items())}
+            shapeProxies.append(displaylist.DisplayListBuffer.FromArrays(shapeArrays, int(flags[i]), int(welded[i])))
+        # the entry mtime is its last use
+        os.utime(path)
+        return CachedModel(shapeProxies, draws)
+
+    def Store(self, key, modelIndex, shapeProxies, draws):
+        """draws is the CollectorSink.GetArrays of the model render."""
+        path = self._EntryPath(key, modelIndex)
+        if os.path.isfile(path):
+            return
+        names = displaylist.DisplayListBuffer.ArrayNames
+        shapeArrays = [buffer.GetArrays() for buffer in shapeProxies]
+        offsets = np.zeros((len(shapeProxies) + 1, len(names)), dtype=np.int64)
+        offsets[1:] = np.cumsum([[len(arrays[name]) for name in names] for arrays in shapeArrays], axis=0).reshape(-1, len(names))
+        entry = {f"shapes.{name}": np.concatenate([arrays[name] for arrays in shapeArrays]) if shapeArrays else np.empty(0)
+                 for name in names}
+        entry.update((f"draws.{name}", draws[name]) for name in DrawArrayNames)
+        entry["offsets"] = offsets
+        entry["flags"] = np.array([buffer.Flags for buffer in shapeProxies], dtype=np.int32)
+        entry["welded"] = np.array([buffer.WeldedVertexCount for buffer in shapeProxies], dtype=np.int32)
+        # written aside then renamed, the rename publishing the whole entry at once to a concurrent Load
+        tmpPath = f"{path}.tmp{os.getpid()}"
+        try:
+            with open(tmpPath, "wb") as file:
+                np.savez(file, **entry)
+                size = file.tell()
+            os.replace(tmpPath, path)
+        except OSError:
+            try:
+                os.remove(tmpPath)
+            except OSError:
+                pass
+            return
+        self._AddUsage(size, keep=path)
+
+    def _AddUsage(self, size, keep):
+        usage = _usage.get(self.Directory)
+        if usage is None or usage[1] + size > self.Budget // WalkFraction:
+            # nothing counted yet, or enough stored since the last walk for the other processes
+            # to have stored much too
+            self.Trim(keep)
+            return
+        usage[0] += size
+        usage[1] += size
+        if usage[0] > self.Budget:
+            self.Trim(keep)
+
+    def _Walk(self, tmpAge):
+        """Returns (last use, size, path) of every entry, removing the temporary files older than
+        tmpAge seconds and the entry directories of the previous cache formats."""
+        entries = []
+        now = time.time()
+        with os.scandir(self.Directory) as files:
+            for file in files:
+                try:
+                    if file.is_dir(follow_symlinks=False):
+                        shutil.rmtree(file.path, ignore_errors=True)
+                    elif ".tmp" in file.name:
+                        if now - file.stat().st_mtime >= tmpAge:
+                            os.remove(file.path)
+                    elif file.name.endswith(".npz"):
+                        stat = file.stat()
+                        entries.append((stat.st_mtime, stat.st_size, file.path))
+                except OSError:
+                    # removed meanwhile by another process
+                    pass
+        return entries
+
+    def GetEntries(self):
+        """Returns (last use, size, path) of every entry, removing the stale temporary files."""
+        return self._Walk(StaleTmpAge)
+
+    def Trim(self, keep=None):
+        entries = sorted(self.GetEntries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.Budget:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        _usage[self.Directory] = [total, 0]
+
+    def Clear(self):
+        # the temporary files of a Store under way too, which then fails and stores nothing
+        for _, _, path in self._Walk(0):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _usage[self.Directory] = [0, 0]
@@ -0,0 +1 @@
+from .lz import *
@@ -0,0 +1,323 @@
+import numpy as np
+
+LZ10 = 0x10
+LZ11 = 0x11
+
+# biggest flag block : the flag byte then 8 references (2 bytes each for LZ10, up to 4 for LZ11)
+MaxBlockSize = {
+    LZ10 : 1 + 8 * 2,
+    LZ11 : 1 + 8 * 4,
+}
+
+def IsCompressed(data) -> bool:
+    return len(data) >= 4 and data[0] in (LZ10, LZ11) and GetDecompressedSize(data)[0] > 0
+
+def GetDecompressedSize(data):
+    """Returns the decompressed size and the header size of a LZ10/LZ11 stream."""
+    size = data[1] | data[2] << 8 | data[3] << 16
+    if size == 0 and len(data) >= 8:
+        return data[4] | data[5] << 8 | data[6] << 16 | data[7] << 24, 8
+    return size, 4
+
+def DecodeBlocks(src, pos, srcEnd, out, outPos, outEnd, lz11, final=True):
+    """Decodes flag blocks of src[pos:srcEnd] into the preallocated out[outPos:outEnd].
+    Unless final is set, decoding stops before a block that may not be complete in src.
+    Returns the new (pos, outPos)."""
+    try:
+        return DecodeBlocksUnchecked(src, pos, srcEnd, out, outPos, outEnd, lz11, final)
+    except IndexError:
+        raise Exception("Truncated LZ stream.")
+
+def DecodeBlocksUnchecked(src, pos, srcEnd, out, outPos, outEnd, lz11, final):
+    blockSize = MaxBlockSize[LZ11 if lz11 else LZ10]
+    while outPos < outEnd:
+        if not final and pos + blockSize > srcEnd:
+            break
+        if pos >= srcEnd:
+            raise Exception("Truncated LZ stream.")
+        flags = src[pos]
+        pos += 1
+
+        if flags == 0:
+            # 8 literals in a row
+            count = min(8, outEnd - outPos, srcEnd - pos)
+            out[outPos:outPos + count] = src[pos:pos + count]
+            pos += count
+            outPos += count
+            continue
+
+        for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+            if outPos >= outEnd:
+                break
+            if flags & bit == 0:
+                out[outPos] = src[pos]
+                pos += 1
+                outPos += 1
+                continue
+
+            b0 = src[pos]
+            b1 = src[pos + 1]
+            if not lz11:
+                length = (b0 >> 4) + 3
+                disp = ((b0 & 0xF) << 8 | b1) + 1
+                pos += 2
+            else:
+                indicator = b0 >> 4
+                if indicator == 0:
+                    b2 = src[pos + 2]
+                    length = ((b0 & 0xF) << 4 | b1 >> 4) + 0x11
+                    disp = ((b1 & 0xF) << 8 | b2) + 1
+                    pos += 3
+                elif indicator == 1:
+                    b2 = src[pos + 2]
+                    b3 = src[pos + 3]
+                    length = ((b0 & 0xF) << 12 | b1 << 4 | b2 >> 4) + 0x111
+                    disp = ((b2 & 0xF) << 8 | b3) + 1
+                    pos += 4
+                else:
+                    length = indicator + 1
+                    disp = ((b0 & 0xF) << 8 | b1) + 1
+                    pos += 2
+
+            start = outPos - disp
+            if start < 0:
+                raise Exception(f"Invalid LZ back reference at output offset {outPos}.")
+            length = min(length, outEnd - outPos)
+            if disp >= length:
+                out[outPos:outPos + length] = out[start:start + length]
+            else:
+                # overlapping copy, the last disp bytes repeat
+                out[outPos:outPos + length] = (out[start:outPos] * (length // disp + 1))[:length]
+            outPos += length
+    return pos, outPos
+
+def Decompress(data):
+    """Decompresses a whole LZ10/LZ11 buffer, returns a memoryview over the output."""
+    if not isinstance(data, (bytes, bytearray)):
+        # indexing a memoryview is noticeably slower than indexing bytes
+        data = bytes(data)
+    if data[0] not in (LZ10, LZ11):
+        raise Exception(f"Unsupported compression type : {data[0]:#x}")
+    size, headerSize = GetDecompressedSize(data)
+    out = bytearray(size)
+    pos, outPos = DecodeBlocks(data, headerSize, len(data), out, 0, size, data[0] == LZ11)
+    return memoryview(out)
+
+def DecompressLz10(data):
+    if data[0] != LZ10:
+        raise Exception(f"Expected LZ10 data, got type {data[0]:#x}")
+    return Decompress(data)
+
+def DecompressLz11(data):
+    if data[0] != LZ11:
+        raise Exception(f"Expected LZ11 data, got type {data[0]:#x}")
+    return Decompress(data)
+
+class LzDecompressor:
+    """Incremental LZ10/LZ11 decompressor, compressed data is given chunk by chunk with Feed
+    and decoded straight into the preallocated Output as soon as whole blocks are available."""
+    def __init__(self):
+        self._pending = bytearray()
+        self._lz11 = False
+        self.Output = None
+        self.Position = 0
+
+    @property
+    def IsFinished(self) -> bool:
+        return self.Output is not None and self.Position == len(self.Output)
+
+    def Feed(self, chunk):
+        self._pending += chunk
+        if self.Output is None:
+            self._ReadHeader()
+            if self.Output is None:
+                return
+        self._Decode(final=False)
+
+    def Finish(self):
+        if self.Output is None:
+            raise Exception("Truncated LZ header.")
+        self._Decode(final=True)
+        return memoryview(self.Output)
+
+    def _ReadHeader(self):
+        pending = self._pending
+        if len(pending) < 4:
+            return
+        if pending[0] not in (LZ10, LZ11):
+            raise Exception(f"Unsupported compression type : {pending[0]:#x}")
+        if pending[1] | pending[2] | pending[3] == 0 and len(pending) < 8:
+            return
+        size, headerSize = GetDecompressedSize(pending)
+        self._lz11 = pending[0] == LZ11
+        self.Output = bytearray(size)
+        del pending[:headerSize]
+
+    def _Decode(self, final):
+        pos, self.Position = DecodeBlocks(self._pending, 0, len(self._pending), self.Output,
+                                          self.Position, len(self.Output), self._lz11, final)
+        del self._pending[:pos]
+
+def DecompressStream(file, header=b"", chunkSize=0x10000):
+    """Decompresses a LZ10/LZ11 file object chunk by chunk, header being the bytes of the
+    stream already read from file."""
+    decompressor = LzDecompressor()
+    decompressor.Feed(header)
+    while not decompressor.IsFinished:
+        chunk = file.read(chunkSize)
+        if not chunk:
+            break
+        decompressor.Feed(chunk)
+    return decompressor.Finish()
+
+MinMatchLength = 3
+MaxMatchLength = {
+    LZ10 : 0x12,
+    LZ11 : 0x10110,
+}
+WindowSize = 0x1000
+# the BIOS VRAM decompressor writes 16 bits at a time, a displacement of 1 would read
+# a byte that has not been written yet
+MinDisplacement = 2
+DefaultLevel = 6
+
+# level : (hash chain candidates tried per position, match length good enough to stop searching, lazy matching)
+CompressionLevels = {
+    1 : (4, 8, False),
+    2 : (8, 16, False),
+    3 : (16, 32, False),
+    4 : (16, 64, False),
+    5 : (32, 128, False),
+    6 : (32, 0x10110, False),
+    7 : (64, 0x10110, True),
+    8 : (128, 0x10110, True),
+    9 : (512, 0x10110, True),
+}
+
+def BuildHashChains(data):
+    """For every position, the previous position starting with the same 3 bytes, or -1.
+    Built in one vectorized pass instead of inserting positions one by one."""
+    if len(data) < MinMatchLength:
+        return []
+    d = np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+    keys = d[:-2] | d[1:-1] << 8 | d[2:] << 16
+    order = np.argsort(keys, kind="stable")
+    sortedKeys = keys[order]
+    same = sortedKeys[1:] == sortedKeys[:-1]
+    prev = np.full(len(keys), -1, dtype=np.int64)
+    prev[order[1:][same]] = order[:-1][same]
+    return prev.tolist()
+
+def MatchLength(data, a, b, limit):
+    """Length of the common run of data[a:] and data[b:], up to limit, knowing the first
+    MinMatchLength bytes are equal. Compares galloping slices then bisects the mismatch
+    instead of testing bytes one by one."""
+    lo = MinMatchLength
+    step = 16
+    while True:
+        hi = min(lo + step, limit)
+        if data[a + lo:a + hi] != data[b + lo:b + hi]:
+            break
+        lo = hi
+        if lo == limit:
+            return lo
+        step <<= 1
+    # data[a:a + lo] matches, the first mismatch is in [lo, hi)
+    while hi - lo > 1:
+        mid = (lo + hi) >> 1
+        if data[a + lo:a + mid] == data[b + lo:b + mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+class LzMatchFinder:
+    def __init__(self, data, maxLength, level):
+        self._data = data
+        self._prev = BuildHashChains(data)
+        self._maxLength = maxLength
+        self._maxChain, self._niceLength, _ = CompressionLevels[level]
+
+    def Find(self, pos):
+        """Returns the (length, displacement) of the longest match found for pos."""
+        data = self._data
+        prev = self._prev
+        if pos >= len(prev):
+            return 0, 0
+        limit = min(self._maxLength, len(data) - pos)
+        nice = min(self._niceLength, limit)
+        best = 0
+        bestDisp = 0
+        chain = self._maxChain
+        candidate = prev[pos]
+        while candidate >= 0 and chain > 0:
+            disp = pos - candidate
+            if disp > WindowSize:
+                break
+            if disp >= MinDisplacement and data[candidate + best] == data[pos + best]:
+                length = MatchLength(data, candidate, pos, limit)
+                if length > best:
+                    best = length
+                    bestDisp = disp
+                    if best >= nice:
+                        break
+            candidate = prev[candidate]
+            chain -= 1
+        return best, bestDisp
+
+def EncodeReference(out, length, disp, lz11):
+    d = disp - 1
+    if not lz11:
+        out += bytes(((length - 3) << 4 | d >> 8, d & 0xFF))
+    elif length <= 0x10:
+        out += bytes(((length - 1) << 4 | d >> 8, d & 0xFF))
+    elif length <= 0x110:
+        l = length - 0x11
+        out += bytes((l >> 4, (l & 0xF) << 4 | d >> 8, d & 0xFF))
+    else:
+        l = length - 0x111
+        out += bytes((1 << 4 | l >> 12, l >> 4 & 0xFF, (l & 0xF) << 4 | d >> 8, d & 0xFF))
+
+def Compress(data, type=LZ10, level=DefaultLevel):
+    """Compresses data to a LZ10 or LZ11 stream. Levels go from 1 (fastest) to 9 (smallest),
+    level 0 only stores literals."""
+    if type not in (LZ10, LZ11):
+        raise Exception(f"Unsupported compression type : {type:#x}")
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    lz11 = type == LZ11
+    size = len(data)
+    if size <= 0xFFFFFF and size > 0:
+        out = bytearray((type, size & 0xFF, size >> 8 & 0xFF, size >> 16 & 0xFF))
+    else:
+        out = bytearray((type, 0, 0, 0, size & 0xFF, size >> 8 & 0xFF, size >> 16 & 0xFF, size >> 24 & 0xFF))
+
+    finder = LzMatchFinder(data, MaxMatchLength[type], level) if level > 0 else None
+    lazy = level > 0 and CompressionLevels[level][2]
+    pos = 0
+    while pos < size:
+        flagPos = len(out)
+        out.append(0)
+        for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+            if pos >= size:
+                break
+            length, disp = finder.Find(pos) if finder is not None else (0, 0)
+            if length >= MinMatchLength and lazy and length < MaxMatchLength[type]:
+                # emit a literal instead if the next position has a longer match
+                if finder.Find(pos + 1)[0] > length:
+                    length = 0
+            if length < MinMatchLength:
+                out.append(data[pos])
+                pos += 1
+                continue
+            out[flagPos] |= bit
+            EncodeReference(out, length, disp, lz11)
+            pos += length
+    out += bytes(-len(out) % 4)
+    return bytes(out)
+
+def CompressLz10(data, level=DefaultLevel):
+    return Compress(data, LZ10, level)
+
+def CompressLz11(data, level=DefaultLevel):
+    return Compress(data, LZ11, level)
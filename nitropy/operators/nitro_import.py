@@ -1,48 +1,283 @@
+import os
+import time
 import bpy
+import numpy as np
+from collections import deque
 from bpy_extras.io_utils import ExportHelper, ImportHelper
-from bpy.props import StringProperty, EnumProperty, BoolProperty, CollectionProperty
+from bpy.props import StringProperty, EnumProperty, BoolProperty, IntProperty, CollectionProperty
 
-from ..binary import nsbmd, model
+from ..binary import displaylist
+from .. import batch
 
-def axis_convert(v):
-    x, y, z = (v[0], v[1], v[2])
-    return [x, -z, y]
+def axis_convert(positions):
+    """Nitro y up positions to Blender z up, as a contiguous float32 array."""
+    converted = np.empty((len(positions), 3), dtype=np.float32)
+    converted[:, 0] = positions[:, 0]
+    converted[:, 1] = -positions[:, 2]
+    converted[:, 2] = positions[:, 1]
+    return converted
 
-def vertex_colors(vertex):
-    x, y, z = vertex
-    return [x, y, z, 1.0]
+# DisplayListBuffer texcoords are the raw 1/16 texel values divided by 512
+TEXEL_SCALE = 512 / 16
 
-def render_shp(shp, buffer):
-    mesh_name = "test"
-    mesh = bpy.data.meshes.new(name=mesh_name)
-    mesh_obj = bpy.data.objects.new(name=mesh_name, object_data=mesh)
-    bpy.context.collection.objects.link(mesh_obj)
-    bpy.context.view_layer.objects.active = mesh_obj
-    mesh_obj.select_set(True)
-    bpy.ops.object.mode_set(mode='OBJECT')
+def loop_uvs(buffer, loops, texture_size):
+    """Per loop uvs, from texels to the 0..1 range of the texture when its size is known."""
+    uvs = buffer.TexCoords[loops] * TEXEL_SCALE
+    if texture_size is not None:
+        uvs /= texture_size
+        # the texture t axis goes down, the Blender v one up
+        uvs[:, 1] = 1.0 - uvs[:, 1]
+    return np.ascontiguousarray(uvs, dtype=np.float32)
+
+def loop_colors(buffer, loops):
+    """Per loop RGBA, white on the vertices whose NormalsOrColors row holds a normal."""
+    colors = np.ones((len(loops), 4), dtype=np.float32)
+    colors[:, :3] = np.where(buffer.HasNormal()[loops, None], 1.0, buffer.NormalsOrColors[loops])
+    return colors
+
+def loop_normals(buffer, loops):
+    """Per loop Blender space normals, zero (the automatic normal) on the vertices with a color."""
+    normals = np.where(buffer.HasNormal()[:, None], buffer.NormalsOrColors, 0.0)
+    return axis_convert(normals)[loops]
+
+def render_shp(name, buffer, texture_size=None):
+    """Builds the mesh of a decoded shape in bulk and links it to the active collection.
+    texture_size is the (width, height) of the shape texture, to normalize its uvs."""
+    mesh = bpy.data.meshes.new(name=name)
+    
+    loops = np.ascontiguousarray(buffer.Loops, dtype=np.int32)
+    mesh.vertices.add(len(buffer.Positions))
+    mesh.vertices.foreach_set("co", axis_convert(buffer.Positions).ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set("vertex_index", loops)
+    mesh.polygons.add(len(buffer.LoopStarts))
+    mesh.polygons.foreach_set("loop_start", np.ascontiguousarray(buffer.LoopStarts, dtype=np.int32))
+    # read only since Blender 4.0, where the polygon sizes follow from the loop starts
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.ascontiguousarray(buffer.LoopTotals, dtype=np.int32))
+    
+    # the per loop attributes are gathered from the vertex arrays through the loop vertex indices
+    if buffer.Flags & displaylist.DlFlags.HasTexCoords:
+        uv_layer = mesh.uv_layers.new(name="UVMap")
+        uv_layer.data.foreach_set("uv", loop_uvs(buffer, loops, texture_size).ravel())
+    if buffer.Flags & displaylist.DlFlags.HasColors:
+        if hasattr(mesh, "color_attributes"):
+            color_layer = mesh.color_attributes.new(name="Color", type='BYTE_COLOR', domain='CORNER')
+        else:
+            color_layer = mesh.vertex_colors.new(name="Color")
+        color_layer.data.foreach_set("color", loop_colors(buffer, loops).ravel())
+    mesh.update(calc_edges=True)
     
-    verts = []
-    for i in range(len(buffer._vtxData)):
-        verts.append(axis_convert(buffer._vtxData[i].Position))
+    if buffer.Flags & displaylist.DlFlags.HasNormals:
+        mesh.polygons.foreach_set("use_smooth", np.ones(len(buffer.LoopStarts), dtype=bool))
+        # custom normals only apply with auto smooth before Blender 4.1
+        if hasattr(mesh, "use_auto_smooth"):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(loop_normals(buffer, loops))
     
-    mesh.from_pydata(verts, [], buffer._idxData)
+    mesh_obj = bpy.data.objects.new(name=name, object_data=mesh)
+    bpy.context.collection.objects.link(mesh_obj)
+    return mesh_obj
+
+def build_model(decoded):
+    """Creates the mesh objects of a batch.DecodedModel."""
+    for shape_index, material_index, buffer in decoded.Draws:
+        render_shp(decoded.ShapeNames[shape_index], buffer, decoded.GetTextureSize(material_index))
+
+def open_nitro(context, filepath, use_cache=True, weld=False, quads=False, all_models=False, model_names=None):
+    """Imports a single file in this process, returns the number of vertices removed by welding."""
+    path, models, error = batch.DecodeFile(filepath, None, batch.DecodeOptions(use_cache, weld, quads, all_models, model_names))
+    if error is not None:
+        raise Exception(error)
+    for decoded in models:
+        build_model(decoded)
+    return sum(decoded.WeldedVertexCount for decoded in models)
 
-def open_nitro(context, filepath):
-    filedata = open(filepath, "rb")
+def import_files(context, filepaths, options=None, workers=None):
+    """Decodes the files over worker processes and builds their meshes here as they come
+    back, in order. options is a batch.DecodeOptions. Returns the number of vertices
+    removed by welding and the errors."""
+    wm = context.window_manager
+    wm.progress_begin(0, len(filepaths))
+    welded = 0
+    errors = []
+    try:
+        for i, (path, models, error) in enumerate(batch.DecodeFiles(filepaths, workers, options)):
+            if error is not None:
+                errors.append(f"{os.path.basename(path)}: {error}")
+            for decoded in models:
+                build_model(decoded)
+                welded += decoded.WeldedVertexCount
+            wm.progress_update(i + 1)
+    finally:
+        wm.progress_end()
+    return welded, errors
+
+# seconds of mesh building per timer event of a background import, and between the events
+BUILD_SLICE = 0.05
+TIMER_STEP = 0.01
+
+class BackgroundImport:
+    """Decodes the files on a batch.BackgroundDecoder and builds their meshes in time slices,
+    one draw at a time, from the timer events of the modal operator."""
+    def __init__(self, filepaths, options=None, workers=None):
+        self.decoder = batch.BackgroundDecoder(filepaths, workers, options)
+        self.file_count = len(filepaths)
+        self.files_done = 0
+        self.shape_count = 0
+        self.vertex_count = 0
+        self.welded = 0
+        self.errors = []
+        self.pending = deque()
+        self.start_time = time.perf_counter()
+    
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.decoder.Start()
     
-    if filepath.endswith(".nsbmd"):
-        modeldata = nsbmd.Nsbmd(reader=filedata)
-        rendergroup = model.ModelRenderGroup(modeldata)
-        rendergroup.InitModel()
-        rendergroup.Render()
+    def cancel(self):
+        self.decoder.Cancel()
+    
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+    
+    def _next_file(self):
+        result = self.decoder.Get()
+        if result is None:
+            return False
+        path, models, error = result
+        if error is not None:
+            self.errors.append(f"{os.path.basename(path)}: {error}")
+        for decoded in models:
+            self.welded += decoded.WeldedVertexCount
+            self.pending.extend((decoded, draw) for draw in decoded.Draws)
+        self.files_done += 1
+        return True
+    
+    def step(self, budget=BUILD_SLICE):
+        """Builds meshes for about budget seconds. Returns True once every file is imported."""
+        end = time.perf_counter() + budget
+        while time.perf_counter() < end:
+            if not self.pending and not self._next_file():
+                break
+            if self.pending:
+                decoded, (shape_index, material_index, buffer) = self.pending.popleft()
+                render_shp(decoded.ShapeNames[shape_index], buffer, decoded.GetTextureSize(material_index))
+                self.shape_count += 1
+                self.vertex_count += len(buffer.Positions)
+        if self.decoder.Error is not None and self.decoder.Error not in self.errors:
+            self.errors.append(self.decoder.Error)
+        return not self.pending and self.decoder.Done
+    
+    def status(self):
+        return (f"Importing : {self.files_done}/{self.file_count} files, {self.shape_count} shapes, "
+                f"{self.vertex_count} vertices, {self.elapsed:.1f} s (Esc to cancel)")
 
 class ImportNitro(bpy.types.Operator, ImportHelper):
     bl_idname = "import.nsbmd"
-    bl_label = "Import a .nsbmd"
+    bl_label = "Import a .nsbmd or .narc"
     bl_options = {'PRESET', 'UNDO'}
     filename_ext = ".nsbmd"
-    filter_glob: StringProperty(default="*.nsbmd", options={'HIDDEN'})
+    filter_glob: StringProperty(default="*.nsbmd;*.narc;*.carc", options={'HIDDEN'})
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+    use_cache: BoolProperty(
+        name="Use Geometry Cache",
+        description="Reuse the geometry decoded by previous imports of the same file",
+        default=True,
+    )
+    
+    merge_vertices: BoolProperty(
+        name="Merge Vertices",
+        description="Merge the vertices shared by several primitives of a shape",
+        default=False,
+    )
+    keep_quads: BoolProperty(
+        name="Keep Quads",
+        description="Import quads and quad strips as quads instead of triangle pairs",
+        default=False,
+    )
+    models: EnumProperty(
+        name="Models",
+        description="Models of the .nsbmd files to import",
+        items=(
+            ('FIRST', "First", "Only the first model of every file"),
+            ('ALL', "All", "Every model of every file"),
+            ('NAMED', "By Name", "The models named in Model Names"),
+        ),
+        default='FIRST',
+    )
+    model_names: StringProperty(
+        name="Model Names",
+        description="Comma separated names of the models to import",
+        default="",
+    )
+    workers: IntProperty(
+        name="Processes",
+        description="Processes decoding the files in parallel, 0 for one per core",
+        default=0,
+        min=0,
+    )
+    background: BoolProperty(
+        name="Import in Background",
+        description="Keep Blender responsive during the import, which Esc cancels",
+        default=True,
+    )
+    
+    def get_filepaths(self):
+        filepaths = [os.path.join(self.directory, file.name) for file in self.files if file.name]
+        return filepaths or [self.filepath]
+    
+    def get_options(self):
+        model_names = [name.strip() for name in self.model_names.split(",") if name.strip()]
+        return batch.DecodeOptions(self.use_cache, self.merge_vertices, self.keep_quads,
+                                   self.models == 'ALL', model_names if self.models == 'NAMED' else None)
+    
+    def report_result(self, welded, errors):
+        for error in errors:
+            self.report({'WARNING'}, error)
+        if welded:
+            self.report({'INFO'}, f"Merged {welded} duplicate vertices")
     
     def execute(self, context):
-        open_nitro(context, self.filepath)
+        # a modal import needs a window for its timer, scripts may run without one
+        if self.background and context.window is not None:
+            return self.start_background(context)
+        welded, errors = import_files(context, self.get_filepaths(), self.get_options(), self.workers or None)
+        self.report_result(welded, errors)
         return {'FINISHED'}
+    
+    def start_background(self, context):
+        self._import = BackgroundImport(self.get_filepaths(), self.get_options(), self.workers or None)
+        self._import.start()
+        wm = context.window_manager
+        wm.progress_begin(0, self._import.file_count)
+        self._timer = wm.event_timer_add(TIMER_STEP, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def finish_background(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self.report_result(self._import.welded, self._import.errors)
+    
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._import.cancel()
+            self.finish_background(context)
+            self.report({'WARNING'}, f"Import cancelled after {self._import.files_done} of {self._import.file_count} files")
+            # the meshes already built stay, finishing keeps them in one undo step
+            return {'FINISHED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        done = self._import.step()
+        context.window_manager.progress_update(self._import.files_done)
+        context.workspace.status_text_set(self._import.status())
+        if done:
+            self.finish_background(context)
+            return {'FINISHED'}
+        return {'RUNNING_MODAL'}
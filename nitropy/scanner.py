@@ -0,0 +1,187 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from .binary import nsbmd, narc, nds
+
+ScannedExtensions = (".nsbmd", ".narc", ".carc", ".nds")
+
+def HasExtension(path, extensions):
+    """Whether path ends with one of extensions (lower case), whatever the case of path."""
+    return path.lower().endswith(extensions)
+
+# G3dModelInfo fields stored in the models table
+InfoColumns = (
+    "NodeCount", "MaterialCount", "ShapeCount",
+    "VertexCount", "PolygonCount", "TriangleCount", "QuadCount",
+    "PosScale", "BoxX", "BoxY", "BoxZ", "BoxW", "BoxH", "BoxD", "BoxPosScale",
+)
+
+# kinds of the names table
+NameKinds = ("node", "material", "texture", "palette")
+
+Schema = f"""
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    member TEXT NOT NULL,
+    modelIndex INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    {", ".join(f"{column} NUMERIC" for column in InfoColumns)}
+);
+CREATE TABLE IF NOT EXISTS names (
+    modelId INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_path ON models(path);
+CREATE INDEX IF NOT EXISTS names_name ON names(kind, name);
+CREATE INDEX IF NOT EXISTS names_model ON names(modelId);
+"""
+
+def ScanModel(model):
+    """Reads the info and dictionary names of a model, without parsing its nodes, materials
+    or shapes."""
+    materials, textures, palettes = model.GetMaterialNames()
+    return {
+        "info": [getattr(model.Info, column) for column in InfoColumns],
+        "node": model.GetNodeNames(),
+        "material": materials,
+        "texture": textures,
+        "palette": palettes,
+    }
+
+def ScanNsbmd(data, member=""):
+    rows = []
+    modelSet = nsbmd.Nsbmd(data).ModelSet
+    for i, entry in enumerate(modelSet.Dictionary.Data):
+        row = ScanModel(modelSet.Models[i])
+        row["member"] = member
+        row["modelIndex"] = i
+        row["name"] = entry.Name
+        rows.append(row)
+    return rows
+
+def ScanFile(path):
+    """Returns (path, rows, error) for a .nsbmd, a NARC archive or a NDS rom.
+    Runs in the worker processes, so everything returned has to be picklable."""
+    try:
+        if HasExtension(path, ".nsbmd"):
+            return path, ScanNsbmd(nsbmd.ReadBuffer(path, True)), None
+        # the rom archives that can not be read, the rest of the rom is still indexed
+        archiveErrors = []
+        if HasExtension(path, ".nds"):
+            members = list(nds.NdsRom.FromFile(path).ScanG3dFiles(signatures=(b"BMD0",), errors=archiveErrors))
+        else:
+            members = [(file.Name, file) for file in narc.Narc.FromFile(path).FindSignature(b"BMD0")]
+        rows = []
+        for name, file in members:
+            rows.extend(ScanNsbmd(file.Data, name))
+        error = "; ".join(f"{name}: {message}" for name, message in archiveErrors) or None
+        return path, rows, error
+    except Exception as e:
+        return path, [], f"{type(e).__name__}: {e}"
+
+def FindFiles(paths):
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.path.abspath(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                if HasExtension(name, ScannedExtensions):
+                    yield os.path.abspath(os.path.join(root, name))
+
+class ModelIndex:
+    """SQLite index of the models of a file corpus. Rescans only parse the files whose
+    size or modification time changed since they were indexed."""
+    def __init__(self, dbPath):
+        self.Connection = sqlite3.connect(dbPath)
+        self.Connection.execute("PRAGMA foreign_keys = ON")
+        self.Connection.executescript(Schema)
+
+    def Close(self):
+        self.Connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+    def Scan(self, paths, workers=None, prune=True):
+        """Indexes the files and directories of paths over workers processes (every core by
+        default, 1 scans in this process). With prune, the indexed files under paths that do not
+        exist anymore are removed. The paths that do not exist are skipped.
+        Returns the (scanned, unchanged, removed) file counts."""
+        db = self.Connection
+        indexed = {path: (size, mtime) for path, size, mtime in db.execute("SELECT path, size, mtime FROM files")}
+        stale = {}
+        unchanged = 0
+        for path in FindFiles(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = (stat.st_size, stat.st_mtime_ns)
+            if indexed.get(path) == key:
+                unchanged += 1
+            else:
+                stale[path] = key
+
+        removed = 0
+        if prune:
+            roots = [os.path.abspath(path) for path in paths]
+            for path in indexed:
+                if not os.path.exists(path) and any(path == root or path.startswith(os.path.join(root, "")) for root in roots):
+                    db.execute("DELETE FROM files WHERE path = ?", (path,))
+                    removed += 1
+
+        for path, rows, error in self._Map(list(stale), workers):
+            size, mtime = stale[path]
+            db.execute("DELETE FROM files WHERE path = ?", (path,))
+            db.execute("INSERT INTO files (path, size, mtime, error) VALUES (?, ?, ?, ?)", (path, size, mtime, error))
+            for row in rows:
+                cursor = db.execute(
+                    f"INSERT INTO models (path, member, modelIndex, name, {', '.join(InfoColumns)}) "
+                    f"VALUES (?, ?, ?, ?{', ?' * len(InfoColumns)})",
+                    (path, row["member"], row["modelIndex"], row["name"], *row["info"]))
+                db.executemany("INSERT INTO names (modelId, kind, name) VALUES (?, ?, ?)",
+                               [(cursor.lastrowid, kind, name) for kind in NameKinds for name in row[kind]])
+        db.commit()
+        return len(stale), unchanged, removed
+
+    @staticmethod
+    def _Map(paths, workers):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(paths) <= 1:
+            yield from map(ScanFile, paths)
+            return
+        with ProcessPoolExecutor(workers) as executor:
+            yield from executor.map(ScanFile, paths, chunksize=max(1, len(paths) // (workers * 8)))
+
+    def Query(self, sql, params=()):
+        return self.Connection.execute(sql, params).fetchall()
+
+    def FindModels(self, minTriangles=None, minVertices=None, node=None, material=None, texture=None, palette=None):
+        """Returns the (path, member, model name) of the models matching every given criterion."""
+        sql = "SELECT path, member, name FROM models WHERE 1"
+        params = []
+        if minTriangles is not None:
+            sql += " AND TriangleCount + QuadCount * 2 >= ?"
+            params.append(minTriangles)
+        if minVertices is not None:
+            sql += " AND VertexCount >= ?"
+            params.append(minVertices)
+        for kind, name in (("node", node), ("material", material), ("texture", texture), ("palette", palette)):
+            if name is not None:
+                sql += " AND id IN (SELECT modelId FROM names WHERE kind = ? AND name = ?)"
+                params += [kind, name]
+        return self.Query(sql + " ORDER BY path, member, modelIndex", params)